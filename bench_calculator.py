@@ -0,0 +1,321 @@
+import asyncio
+import gc
+import hashlib
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from tempfile import TemporaryDirectory
+import tracemalloc
+
+import typer
+import pandas as pd
+from rich.console import Console
+from rich.table import Table
+
+from calculator import (
+    AI21_MODELS,
+    GRID_COLUMNS,
+    GRID_MODELS,
+    LOWER_BOUND_PROMPT_SIZE,
+    MONTHLY_MESSAGES,
+    SERVER_PORT,
+    TOKENS_PER_MESSAGE,
+    UPPER_BOUND_PROMPT_SIZE,
+    calculate_cost,
+    calculate_cost_ai21,
+    export_cost_to_csv,
+    export_cost_to_df,
+)
+
+console = Console()
+
+# Create CLI app with typer
+app = typer.Typer()
+
+
+def measure(function, *args, **kwargs):
+    """
+    Run a function once and measure its wall time and peak traced memory.
+
+    Returns
+    -------
+    result, seconds, peak_bytes : tuple
+        The return value of the function, the elapsed time and the peak memory.
+    """
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    seconds = time.perf_counter() - start
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, seconds, peak_bytes
+
+
+def row_by_row_cost_df(lower_bound_prompt_size, upper_bound_prompt_size):
+    """
+    Build the cost grid the way export_cost_to_df used to: one scalar cost call and one dict per row.
+
+    DataFrame.append no longer exists in pandas 2.x, so the rows are collected in a list
+    and turned into a frame once; this is a lower bound on the old quadratic build.
+    """
+    rows = []
+    for model in GRID_MODELS:
+        scalar = calculate_cost_ai21 if model in AI21_MODELS else calculate_cost
+        for prompt_size in range(lower_bound_prompt_size, upper_bound_prompt_size + 1):
+            for messages_per_day in range(1, 26):
+                tokens_per_month = messages_per_day * TOKENS_PER_MESSAGE
+                rows.append(
+                    {
+                        "Model": model,
+                        "Prompt Size (k words)": prompt_size,
+                        "Messages per Day": messages_per_day,
+                        "Tokens per Month": tokens_per_month,
+                        "Cost per Month ($)": scalar(model, prompt_size, tokens_per_month),
+                    }
+                )
+    return pd.DataFrame(rows, columns=GRID_COLUMNS)
+
+
+@app.command()
+def export_df():
+    """
+    Compare time and memory of the columnar export_cost_to_df with the row-by-row build.
+    """
+    baseline, baseline_seconds, baseline_peak = measure(
+        row_by_row_cost_df, LOWER_BOUND_PROMPT_SIZE, UPPER_BOUND_PROMPT_SIZE
+    )
+    columnar, columnar_seconds, columnar_peak = measure(export_cost_to_df)
+
+    pd.testing.assert_frame_equal(
+        columnar.astype(baseline.dtypes.to_dict()), baseline, check_exact=True
+    )
+
+    table = Table(title=f"export_cost_to_df, {len(columnar)} rows")
+    table.add_column("Builder")
+    table.add_column("Time (s)", justify="right")
+    table.add_column("Peak memory (MB)", justify="right")
+    table.add_column("Frame memory (MB)", justify="right")
+    table.add_row(
+        "row by row",
+        f"{baseline_seconds:.3f}",
+        f"{baseline_peak / 1e6:.1f}",
+        f"{baseline.memory_usage(deep=True).sum() / 1e6:.1f}",
+    )
+    table.add_row(
+        "columnar",
+        f"{columnar_seconds:.3f}",
+        f"{columnar_peak / 1e6:.1f}",
+        f"{columnar.memory_usage(deep=True).sum() / 1e6:.1f}",
+    )
+    console.print(table)
+    console.print(f"Speedup: {baseline_seconds / columnar_seconds:.0f}x, results identical.", style="bold green")
+
+
+
+@app.command()
+def workers(
+    lower_bound_prompt_size: int = 1,
+    upper_bound_prompt_size: int = 20000,
+    max_workers: int = 8,
+):
+    """
+    Measure how export_cost_to_csv scales with 1, 2, 4, ... worker processes on a widened grid.
+    """
+    table = Table(title=f"export_cost_to_csv, prompt sizes {lower_bound_prompt_size}..{upper_bound_prompt_size}")
+    table.add_column("Workers", justify="right")
+    table.add_column("Time (s)", justify="right")
+    table.add_column("Speedup", justify="right")
+    table.add_column("SHA-256")
+
+    serial_seconds = None
+    digests = set()
+    with TemporaryDirectory() as tempdir:
+        file = os.path.join(tempdir, "costs.csv")
+        worker_counts = [1]
+        while worker_counts[-1] * 2 <= max_workers:
+            worker_counts.append(worker_counts[-1] * 2)
+        for worker_count in worker_counts:
+            start = time.perf_counter()
+            export_cost_to_csv(
+                file,
+                lower_bound_prompt_size=lower_bound_prompt_size,
+                upper_bound_prompt_size=upper_bound_prompt_size,
+                workers=worker_count,
+            )
+            seconds = time.perf_counter() - start
+            serial_seconds = serial_seconds or seconds
+            with open(file, "rb") as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+            digests.add(digest)
+            table.add_row(str(worker_count), f"{seconds:.3f}", f"{serial_seconds / seconds:.2f}x", digest[:16])
+
+    console.print(table)
+    console.print(f"CPUs available: {os.cpu_count()}")
+    if len(digests) != 1:
+        raise typer.Exit(f"Outputs differ between worker counts: {sorted(digests)}")
+    console.print("Outputs are byte-identical.", style="bold green")
+
+
+
+def import_time_us(module="calculator"):
+    """
+    Measure the cumulative import time of a module in a fresh interpreter with python -X importtime.
+
+    Returns
+    -------
+    total_us, modules : tuple
+        The cumulative import time of `module` in microseconds, and the cumulative time
+        of every module it imported.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    modules = {}
+    for line in result.stderr.splitlines()[1:]:
+        _, cumulative_us, name = line.split("|")
+        modules[name.strip()] = int(cumulative_us)
+    return modules[module], modules
+
+
+@app.command()
+def startup(runs: int = 10):
+    """
+    Measure the import time of calculator.py and list the slowest top-level imports.
+    """
+    totals = []
+    for _ in range(runs):
+        total_us, modules = import_time_us()
+        totals.append(total_us)
+
+    table = Table(title="Slowest imports of the last run")
+    table.add_column("Module")
+    table.add_column("Cumulative (ms)", justify="right")
+    slowest = sorted(modules.items(), key=lambda item: item[1], reverse=True)
+    for name, cumulative_us in [item for item in slowest if "." not in item[0]][:10]:
+        table.add_row(name, f"{cumulative_us / 1000:.1f}")
+    console.print(table)
+    console.print(
+        f"import calculator: median {statistics.median(totals) / 1000:.1f} ms, "
+        f"min {min(totals) / 1000:.1f} ms over {runs} runs",
+        style="bold green",
+    )
+
+
+
+async def _post(reader, writer, path, body):
+    writer.write(
+        f"POST {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n\r\n".encode()
+        + body
+    )
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line == b"\r\n":
+            break
+        name, _, value = line.decode().partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    await reader.readexactly(length)
+    return status
+
+
+async def _load(host, port, path, body, connections, requests):
+    latencies = []
+    remaining = requests
+
+    async def client():
+        nonlocal remaining
+        reader, writer = await asyncio.open_connection(host, port)
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            status = await _post(reader, writer, path, body)
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                raise RuntimeError(f"{path} answered {status}")
+        writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(connections)))
+    return latencies, time.perf_counter() - start
+
+
+@app.command()
+def load(
+    host: str = "127.0.0.1",
+    port: int = SERVER_PORT + 1,
+    spawn: bool = True,
+    connections: int = 16,
+    requests: int = 5000,
+    batch_size: int = 1000,
+):
+    """
+    Load test the pricing server and report p50/p99 latency and throughput of /quote and /batch.
+
+    With --spawn (the default) a server is started on --port for the duration of the test.
+    """
+    server = None
+    if spawn:
+        server = subprocess.Popen(
+            [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "calculator.py"),
+             "serve", "--host", host, "--port", str(port)],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                asyncio.run(_load(host, port, "/quote", b'{"model": "gpt4_8k", "prompt_size": 1, "tokens_per_month": 1}', 1, 1))
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.1)
+
+        quote = {"model": "gpt4_8k", "prompt_size": 200, "tokens_per_month": MONTHLY_MESSAGES}
+        items = [
+            {"model": GRID_MODELS[i % len(GRID_MODELS)], "prompt_size": 200 + i % 300, "tokens_per_month": 1000 * (1 + i % 25)}
+            for i in range(batch_size)
+        ]
+        table = Table(title=f"Pricing server, {connections} connections")
+        table.add_column("Endpoint")
+        table.add_column("Requests", justify="right")
+        table.add_column("p50 (ms)", justify="right")
+        table.add_column("p99 (ms)", justify="right")
+        table.add_column("Requests/s", justify="right")
+        table.add_column("Quotes/s", justify="right")
+        for path, body, quotes_per_request, count in [
+            ("/quote", json.dumps(quote).encode(), 1, requests),
+            ("/batch", json.dumps({"items": items}).encode(), batch_size, max(connections, requests // 10)),
+        ]:
+            latencies, seconds = asyncio.run(_load(host, port, path, body, connections, count))
+            latencies.sort()
+            table.add_row(
+                path,
+                str(len(latencies)),
+                f"{latencies[len(latencies) // 2] * 1000:.2f}",
+                f"{latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000:.2f}",
+                f"{len(latencies) / seconds:,.0f}",
+                f"{len(latencies) * quotes_per_request / seconds:,.0f}",
+            )
+        console.print(table)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    app()
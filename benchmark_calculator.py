@@ -0,0 +1,81 @@
+"""
+pytest-benchmark suite of the cost paths.
+
+It is not collected by a plain `pytest` run; run it explicitly, saving a JSON baseline
+once and comparing later runs against it:
+
+    python -m pytest benchmark_calculator.py --benchmark-autosave
+    python -m pytest benchmark_calculator.py --benchmark-compare --benchmark-compare-fail=median:20%
+
+Baselines are saved under .benchmarks/, per machine and Python version.
+"""
+import os
+
+import pytest
+from typer.testing import CliRunner
+
+from bench_calculator import import_time_us
+from calculator import (
+    LOWER_BOUND_PROMPT_SIZE,
+    MONTHLY_MESSAGES,
+    UPPER_BOUND_PROMPT_SIZE,
+    app,
+    build_cost_grid,
+    calculate_cost,
+    calculate_cost_ai21,
+    export_cost_to_csv,
+    export_cost_to_df,
+)
+
+pytest.importorskip("pytest_benchmark")
+
+WIDENED_UPPER_BOUND_PROMPT_SIZE = 20000
+
+
+@pytest.mark.benchmark(group="quote")
+@pytest.mark.parametrize("exact", [False, True])
+def test_calculate_cost(benchmark, exact):
+    benchmark(calculate_cost, "gpt4_8k", LOWER_BOUND_PROMPT_SIZE, MONTHLY_MESSAGES, exact=exact)
+
+
+@pytest.mark.benchmark(group="quote")
+def test_calculate_cost_ai21(benchmark):
+    benchmark(calculate_cost_ai21, "jumbo", LOWER_BOUND_PROMPT_SIZE, MONTHLY_MESSAGES)
+
+
+@pytest.mark.benchmark(group="grid")
+@pytest.mark.parametrize("upper_bound_prompt_size", [UPPER_BOUND_PROMPT_SIZE, WIDENED_UPPER_BOUND_PROMPT_SIZE])
+def test_build_cost_grid(benchmark, upper_bound_prompt_size):
+    prompt_sizes = range(LOWER_BOUND_PROMPT_SIZE, upper_bound_prompt_size + 1)
+    benchmark.pedantic(build_cost_grid, kwargs={"prompt_sizes": prompt_sizes}, rounds=5)
+
+
+@pytest.mark.benchmark(group="export")
+@pytest.mark.parametrize("upper_bound_prompt_size", [UPPER_BOUND_PROMPT_SIZE, WIDENED_UPPER_BOUND_PROMPT_SIZE])
+def test_export_cost_to_csv(benchmark, tmp_path, upper_bound_prompt_size):
+    benchmark.pedantic(
+        export_cost_to_csv,
+        args=(os.path.join(tmp_path, "costs.csv"),),
+        kwargs={"upper_bound_prompt_size": upper_bound_prompt_size},
+        rounds=3,
+    )
+
+
+@pytest.mark.benchmark(group="export")
+def test_export_cost_to_df(benchmark):
+    benchmark.pedantic(export_cost_to_df, rounds=5)
+
+
+@pytest.mark.benchmark(group="command")
+def test_calculate_costs(benchmark, tmp_path):
+    runner = CliRunner()
+    arguments = ["calculate-costs", "--export", os.path.join(tmp_path, "costs.csv")]
+    result = benchmark.pedantic(runner.invoke, args=(app, arguments), rounds=3)
+    assert result.exit_code == 0, result.output
+
+
+@pytest.mark.benchmark(group="startup")
+def test_import_time(benchmark):
+    # A fresh interpreter per round; the benchmark includes the interpreter startup
+    total_us, _ = benchmark.pedantic(import_time_us, rounds=5)
+    benchmark.extra_info["import_time_us"] = total_us
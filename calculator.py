@@ -1,12 +1,51 @@
-import itertools
-from tokenizers import Tokenizer
 import typer
-from rich.console import Console
-import tiktoken
+import base64
+import contextlib
 import csv
-import pandas as pd
+import functools
+import gzip
+import hashlib
+import importlib
+import io
+import itertools
+import json
+import math
+import numbers
+import os
+import struct
+import sys
+import time
+import zipfile
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from decimal import Decimal
+from fractions import Fraction
+from typing import List
+
+
+class _LazyImport:
+    """
+    Stand-in for a module or object that is only imported on first attribute access.
+
+    Heavy dependencies are bound through this so a one-line cost query does not pay
+    for importing numpy, pandas, tiktoken or rich.
+    """
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._target = None
 
-console = Console()
+    def __getattr__(self, name):
+        if self._target is None:
+            self._target = self._loader()
+        return getattr(self._target, name)
+
+
+np = _LazyImport(lambda: importlib.import_module("numpy"))
+pd = _LazyImport(lambda: importlib.import_module("pandas"))
+tiktoken = _LazyImport(lambda: importlib.import_module("tiktoken"))
+console = _LazyImport(lambda: importlib.import_module("rich.console").Console())
+asyncio = _LazyImport(lambda: importlib.import_module("asyncio"))
 
 # Create CLI app with typer
 app = typer.Typer()
@@ -26,12 +65,696 @@ LOWER_BOUND_PROMPT_SIZE = 200
 UPPER_BOUND_PROMPT_SIZE = 500
 TOKENS_PER_MESSAGE = 1000
 TOKENS_LIMIT = 4000
+GRID_MESSAGES_PER_DAY = range(1, 26)
+EXPORT_CHUNK_ROWS = 250_000
+EXPORT_BUFFER_SIZE = 8 * 1024 * 1024
+# Chunks in flight per export worker: priced ahead of the writer, but never the whole grid
+EXPORT_CHUNKS_PER_WORKER = 2
+COLUMNAR_FORMATS = ("parquet", "arrow", "npz")
+COLUMNAR_EXTENSIONS = {".parquet": "parquet", ".arrow": "arrow", ".feather": "arrow", ".npz": "npz"}
+EXPORT_FORMATS = ("csv",) + COLUMNAR_FORMATS
+PARTITION_MANIFEST = "manifest.json"
+
+TOKEN_CACHE_SIZE = 65536
+ENCODINGS_DIR = os.environ.get(
+    "AIBILLING_ENCODINGS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "encodings")
+)
+DEFAULT_ENCODING = "cl100k_base"
+# tiktoken encoding of each model; AI21 models use their own tokenizer and are approximated with cl100k_base
+MODEL_ENCODINGS = {
+    "gpt-4": "cl100k_base",
+    "gpt4_8k": "cl100k_base",
+    "gpt4_32k": "cl100k_base",
+    "chat_gpt": "cl100k_base",
+    "embedding_ada": "cl100k_base",
+    "ada": "r50k_base",
+    "babbage": "r50k_base",
+    "curie": "r50k_base",
+    "davinci": "r50k_base",
+    "embedding_curie": "r50k_base",
+}
+# Split pattern and special tokens of the encodings that can be loaded from vendored files
+TIKTOKEN_PATTERNS = {
+    "r50k_base": (
+        r"""'(?:[sdmt]|ll|ve|re)| ?\p{L}++| ?\p{N}++| ?[^\s\p{L}\p{N}]++|\s++$|\s+(?!\S)|\s""",
+        {"<|endoftext|>": 50256},
+    ),
+    "cl100k_base": (
+        r"""'(?i:[sdmt]|ll|ve|re)|[^\r\n\p{L}\p{N}]?+\p{L}++|\p{N}{1,3}+| ?[^\s\p{L}\p{N}]++[\r\n]*+|\s++$|\s*[\r\n]|\s+(?!\S)|\s""",
+        {
+            "<|endoftext|>": 100257,
+            "<|fim_prefix|>": 100258,
+            "<|fim_middle|>": 100259,
+            "<|fim_suffix|>": 100260,
+            "<|endofprompt|>": 100276,
+        },
+    ),
+}
+SERVER_PORT = 8000
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 500: "Internal Server Error"}
+USAGE_BATCH_SIZE = 1024
+USAGE_COLUMNS = ["Model", "Day", "Requests", "Prompt Tokens", "Completion Tokens", "Cost ($)"]
+# Epoch timestamps from this many seconds (year 5138) up are taken as milli-, micro- or nanoseconds
+EPOCH_SECONDS_LIMIT = 1e11
+
+DEFAULT_PRICING_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pricing.json")
+PRICING_SCHEMA_VERSION = 1
+# Bump when the cost formulas change, to invalidate cached costs
+COST_FORMULA_VERSION = 1
+COST_CACHE_SIZE = 65536
+MAX_AFFORDABLE = 2**53
+# Integer steps from the closed form budget estimate before falling back to bisection
+REFINE_STEPS = 64
+# Exact money mode: costs are int64 micro-dollars, rounded half to even
+MICROS_PER_DOLLAR = 1_000_000
+INT64_MAX = 2**63 - 1
+EXACT_COST_COLUMN = "Cost per Month (micro-$)"
+COST_CACHE_FLUSH_SIZE = 10000
+COST_CACHE_MMAP_SIZE = 256 * 1024 * 1024
+SIMULATION_TRIALS = 10000
+SIMULATION_DAYS = 30
+SIMULATION_MESSAGES_PER_DAY = f"negative_binomial:{MESSAGES_PER_DAY},5"
+SIMULATION_PROMPT_TOKENS = "lognormal:500,0.6"
+SIMULATION_PERCENTILES = (50, 95, 99)
+SIMULATION_CHUNK_MESSAGES = 1_000_000
+CONVERSATION_SESSIONS = 100_000
+CONVERSATION_TURNS = "poisson:8"
+CONVERSATION_USER_TOKENS = "lognormal:60,0.8"
+CONVERSATION_COMPLETION_TOKENS = "lognormal:250,0.6"
+# Quantity units of a price sheet, and how many units one price applies to
+UNIT_DIVISORS = {
+    "token": 1000,  # prices are per 1k tokens
+    "image": 1,  # prices are per image
+    "minute": 60,  # prices are per minute, quantities are in seconds
+}
+# Task-Specific API prices per request
+TASK_API_COSTS = {
+    "paraphrase": 0.001,
+    "summarize": 0.005,
+    "grammar_correction": 0.0005,
+    "text_improvement": 0.0005,
+    "text_segmentation": 0.001,
+    "contextual_answers": 0.005,
+}
+GRID_COLUMNS = [
+    "Model",
+    "Prompt Size (k words)",
+    "Messages per Day",
+    "Tokens per Month",
+    "Cost per Month ($)",
+]
+
+
+class Profiler:
+    """
+    Per-stage timers and counters of the cost pipeline.
+
+    Instrumented code reports to the profiler installed with `profiling`; when none is
+    installed, the instrumentation is a single `is None` check.
+
+    Parameters
+    ----------
+    hooks : iterable of callable, optional
+        Called as hook(event, name, value) on every finished stage ("stage", name,
+        seconds) and every count ("count", name, value).
+    """
+
+    def __init__(self, hooks=()):
+        self.hooks = list(hooks)
+        self.stages = {}
+        self.counters = {}
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """
+        Time a stage of the pipeline; stages may nest, their times are inclusive.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            totals = self.stages.setdefault(name, [0, 0.0])
+            totals[0] += 1
+            totals[1] += seconds
+            for hook in self.hooks:
+                hook("stage", name, seconds)
+
+    def count(self, name, value=1):
+        """
+        Add `value` to a counter.
+        """
+        self.counters[name] = self.counters.get(name, 0) + value
+        for hook in self.hooks:
+            hook("count", name, value)
+
+    def summary(self):
+        """
+        The recorded stages and counters, as a JSON-serializable dict.
+        """
+        return {
+            "stages": {name: {"calls": calls, "seconds": seconds} for name, (calls, seconds) in self.stages.items()},
+            "counters": dict(self.counters),
+        }
+
+    def print_summary(self):
+        """
+        Print the stages and counters as rich tables.
+        """
+        from rich.table import Table
+
+        stages = Table(title="Profile: stages")
+        stages.add_column("Stage")
+        stages.add_column("Calls", justify="right")
+        stages.add_column("Time (s)", justify="right")
+        for name, (calls, seconds) in sorted(self.stages.items(), key=lambda item: -item[1][1]):
+            stages.add_row(name, f"{calls:,}", f"{seconds:.4f}")
+        counters = Table(title="Profile: counters")
+        counters.add_column("Counter")
+        counters.add_column("Value", justify="right")
+        for name, value in sorted(self.counters.items()):
+            counters.add_row(name, f"{value:,}")
+        console.print(stages)
+        console.print(counters)
+
+
+_PROFILER = None
+_NO_STAGE = contextlib.nullcontext()
+
+
+@contextlib.contextmanager
+def profiling(profiler=None):
+    """
+    Install a profiler for the duration of a `with` block.
+
+    Parameters
+    ----------
+    profiler : Profiler, optional
+        The profiler to record to, default is a new one.
+
+    Yields
+    ------
+    profiler : Profiler
+        The installed profiler.
+    """
+    global _PROFILER
+    previous = _PROFILER
+    _PROFILER = profiler if profiler is not None else Profiler()
+    try:
+        yield _PROFILER
+    finally:
+        _PROFILER = previous
+
+
+def _stage(name):
+    return _NO_STAGE if _PROFILER is None else _PROFILER.stage(name)
+
+
+def _count(name, value=1):
+    if _PROFILER is not None:
+        _PROFILER.count(name, value)
+
+
+@contextlib.contextmanager
+def _profiled_command(profile, profile_json):
+    """
+    Profile a CLI command when --profile or --profile-json is given, and report at the end.
+    """
+    if not (profile or profile_json):
+        yield
+        return
+    with profiling() as profiler:
+        try:
+            with profiler.stage("total"):
+                yield
+        finally:
+            if profile:
+                profiler.print_summary()
+            if profile_json:
+                with open(profile_json, "w") as f:
+                    json.dump(profiler.summary(), f, indent=4)
+
+
+class ModelPrice:
+    """
+    Immutable price record of one model.
+
+    Parameters
+    ----------
+    name : str
+        The model name.
+    vendor : str
+        The vendor of the model ("openai" or "ai21").
+    unit : str
+        The quantity unit of the prices, one of UNIT_DIVISORS.
+    prompt_price : float
+        The price per unit of prompt.
+    completion_price : float
+        The price per unit of completion.
+    completion_multiplier : float
+        The number of completion tokens generated per prompt token.
+    scales_with_prompt : bool
+        Whether the cost is proportional to the prompt size.
+    context_window : int, optional
+        The maximum number of prompt and completion tokens of one request, of token
+        priced models.
+    """
+
+    __slots__ = (
+        "name",
+        "vendor",
+        "unit",
+        "prompt_price",
+        "completion_price",
+        "completion_multiplier",
+        "scales_with_prompt",
+        "context_window",
+    )
+
+    def __init__(
+        self,
+        name,
+        vendor,
+        unit,
+        prompt_price,
+        completion_price=0.0,
+        completion_multiplier=1,
+        scales_with_prompt=False,
+        context_window=None,
+    ):
+        if unit not in UNIT_DIVISORS:
+            raise ValueError(f"Invalid unit {unit!r} for model {name!r}.")
+        for slot, value in zip(
+            self.__slots__,
+            (
+                name,
+                vendor,
+                unit,
+                float(prompt_price),
+                float(completion_price),
+                completion_multiplier,
+                bool(scales_with_prompt),
+                None if context_window is None else int(context_window),
+            ),
+        ):
+            object.__setattr__(self, slot, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __eq__(self, other):
+        if not isinstance(other, ModelPrice):
+            return NotImplemented
+        return self.as_dict() == other.as_dict()
+
+    def __hash__(self):
+        return hash(tuple(self.as_dict().values()))
+
+    def __reduce__(self):
+        return type(self), tuple(getattr(self, slot) for slot in self.__slots__)
+
+    def __repr__(self):
+        fields = ", ".join(f"{slot}={getattr(self, slot)!r}" for slot in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+    @property
+    def divisor(self):
+        return UNIT_DIVISORS[self.unit]
+
+    def micro_rate(self):
+        """
+        The exact cost in micro-dollars of one unit of cost weight, see calculate_cost.
+
+        The weight is tokens_per_month * max(prompt_size - 1, 0) for models that scale
+        with the prompt, and tokens_per_month otherwise.
+
+        Raises
+        ------
+        ValueError
+            If a price is not a whole number of micro-dollars.
+        """
+        prompt_price = to_micros(self.prompt_price)
+        if not self.scales_with_prompt:
+            return Fraction(prompt_price, self.divisor)
+        completion_price = to_micros(self.completion_price) * Fraction(repr(self.completion_multiplier))
+        return (prompt_price + completion_price) / (4 * self.divisor)
+
+    def as_dict(self):
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+
+class PricingTable:
+    """
+    Registry of model prices, indexed by model name.
+
+    Parameters
+    ----------
+    prices : iterable of ModelPrice
+        The price records, in display order.
+    version : str, optional
+        The version of the price sheet.
+
+    Attributes
+    ----------
+    fingerprint : str
+        A hash of the prices and of COST_FORMULA_VERSION, which changes whenever a cost can change.
+    """
+
+    def __init__(self, prices, version=None):
+        self.version = version
+        self._prices = {}
+        for price in prices:
+            if price.name in self._prices:
+                raise ValueError(f"Duplicate model {price.name!r} in pricing table.")
+            self._prices[price.name] = price
+        self._params = {}
+        self._micro_params = {}
+        self.fingerprint = hashlib.sha256(
+            json.dumps(
+                [COST_FORMULA_VERSION, [price.as_dict() for price in self]], sort_keys=True
+            ).encode()
+        ).hexdigest()
+
+    def __getitem__(self, model):
+        return self._prices[model]
+
+    def __contains__(self, model):
+        return model in self._prices
+
+    def __iter__(self):
+        return iter(self._prices.values())
+
+    def __len__(self):
+        return len(self._prices)
+
+    def get(self, model, vendor=None):
+        """
+        Look up the price record of a model.
+
+        Parameters
+        ----------
+        model : str
+            The model name.
+        vendor : str, optional
+            If given, only models of this vendor are returned.
+
+        Returns
+        -------
+        price : ModelPrice or None
+            The price record, or None if the model is not in the table.
+        """
+        price = self._prices.get(model)
+        if price is None or (vendor is not None and price.vendor != vendor):
+            return None
+        return price
+
+    def models(self, vendor=None):
+        """
+        List the model names of the table, optionally of a single vendor.
+        """
+        return [price.name for price in self if vendor is None or price.vendor == vendor]
+
+    def params(self, models):
+        """
+        Compile the prices of `models` into one float64 row per model for the vectorized engine.
+
+        The columns are prompt price, completion price, completion multiplier, divisor
+        and scales with prompt (0 or 1).
+
+        Raises
+        ------
+        ValueError
+            If one of the models is not in the table.
+        """
+        key = tuple(models)
+        params = self._params.get(key)
+        if params is None:
+            unknown = [model for model in key if model not in self._prices]
+            if unknown:
+                raise ValueError(f"Invalid model(s): {', '.join(unknown)}")
+            params = np.array(
+                [
+                    (
+                        price.prompt_price,
+                        price.completion_price if price.scales_with_prompt else 0.0,
+                        price.completion_multiplier,
+                        price.divisor,
+                        price.scales_with_prompt,
+                    )
+                    for price in map(self._prices.__getitem__, key)
+                ],
+                dtype=np.float64,
+            ).reshape(len(key), 5)
+            self._params[key] = params
+        return params
+
+
+    def micro_params(self, models):
+        """
+        Compile the exact micro-dollar rates of `models` into one int64 row per model.
+
+        The columns are the numerator and denominator of ModelPrice.micro_rate and
+        scales with prompt (0 or 1).
+
+        Raises
+        ------
+        ValueError
+            If one of the models is not in the table, or a price is not a whole number
+            of micro-dollars.
+        """
+        key = tuple(models)
+        params = self._micro_params.get(key)
+        if params is None:
+            self.params(key)  # validates the models
+            rates = [self._prices[model].micro_rate() for model in key]
+            params = np.array(
+                [
+                    (rate.numerator, rate.denominator, self._prices[model].scales_with_prompt)
+                    for model, rate in zip(key, rates)
+                ],
+                dtype=np.int64,
+            ).reshape(len(key), 3)
+            self._micro_params[key] = params
+        return params
+
+
+def load_pricing(file=DEFAULT_PRICING_FILE):
+    """
+    Load a pricing table from a versioned JSON or TOML price sheet.
+
+    Parameters
+    ----------
+    file : str
+        The path of the price sheet, ending in .json or .toml.
+
+    Returns
+    -------
+    pricing : PricingTable
+        The pricing table.
+
+    Raises
+    ------
+    ValueError
+        If the file format or the schema version is not supported.
+    """
+    if file.endswith(".toml"):
+        try:
+            import tomllib
+        except ImportError:  # Python < 3.11
+            import tomli as tomllib
+
+        with open(file, "rb") as f:
+            sheet = tomllib.load(f)
+    elif file.endswith(".json"):
+        with open(file) as f:
+            sheet = json.load(f)
+    else:
+        raise ValueError(f"Unsupported pricing file format: {file}")
+
+    if sheet.get("schema_version") != PRICING_SCHEMA_VERSION:
+        raise ValueError(
+            f"Unsupported pricing schema version {sheet.get('schema_version')!r} in {file}, "
+            f"expected {PRICING_SCHEMA_VERSION}."
+        )
+    return PricingTable(
+        (ModelPrice(name, **fields) for name, fields in sheet["models"].items()),
+        version=sheet.get("version"),
+    )
+
+
+PRICING = load_pricing()
+OPENAI_MODELS = PRICING.models("openai")
+AI21_MODELS = PRICING.models("ai21")
+GRID_MODELS = OPENAI_MODELS + AI21_MODELS
 
 def generate_prompt_from_size_in_tokens(size_in_tokens):
-    return "".join("a" for _ in range(1, size_in_tokens))
+    with _stage("prompt generation"):
+        return "".join("a" for _ in range(1, size_in_tokens))
 
 def generate_prompt_from_size_in_words(size_in_words):
-    return "".join("a" * 4 for _ in range(1, size_in_words))
+    with _stage("prompt generation"):
+        return "".join("a" * 4 for _ in range(1, size_in_words))
+
+def prompt_size_to_token_size(size_in_tokens):
+    """
+    Estimate the number of tokens of a prompt of a given size without generating it.
+
+    This is the closed form of
+    estimate_token_size(generate_prompt_from_size_in_tokens(size_in_tokens)), including
+    its off-by-one: the generated prompt is size_in_tokens - 1 characters long.
+
+    Parameters
+    ----------
+    size_in_tokens : int
+        The size of the prompt.
+
+    Returns
+    -------
+    tokens : float
+        The estimated number of tokens of the prompt.
+    """
+    return max(size_in_tokens - 1, 0) / 4
+
+def estimate_token_size(word):
+    """
+    Estimate the number of tokens of a text from its length, without a tokenizer.
+
+    Parameters
+    ----------
+    word : str
+        The text to estimate.
+
+    Returns
+    -------
+    tokens : float
+        The estimated number of tokens of the text.
+    """
+    # 1 token ~= 4 chars in English
+    return len(str(word)) / 4
+
+
+def _read_tiktoken_ranks(file):
+    # tiktoken's load_tiktoken_bpe would cache the file by path, and serve a stale copy once it changes
+    with open(file, "rb") as f:
+        return {base64.b64decode(token): int(rank) for token, rank in (line.split() for line in f if line.strip())}
+
+
+class TokenCounter:
+    """
+    Token counting service backed by tiktoken encodings, with a bounded LRU cache.
+
+    Counts are cached by (encoding, text hash), so repeated prompt templates are only
+    tokenized once. Encodings are loaded from `<encodings_dir>/<name>.tiktoken` when
+    the file exists, which works offline, and from tiktoken's registry otherwise.
+
+    Parameters
+    ----------
+    maxsize : int, optional
+        The maximum number of cached counts, default is TOKEN_CACHE_SIZE.
+    encodings_dir : str, optional
+        The directory of vendored encoding files, default is ENCODINGS_DIR.
+    """
+
+    def __init__(self, maxsize=None, encodings_dir=None):
+        self.maxsize = TOKEN_CACHE_SIZE if maxsize is None else maxsize
+        self.encodings_dir = encodings_dir or ENCODINGS_DIR
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._encodings = {}
+
+    def encoding(self, model="gpt-4"):
+        """
+        Get the tiktoken encoding of a model, loading it on first use.
+        """
+        name = MODEL_ENCODINGS.get(model, DEFAULT_ENCODING)
+        encoding = self._encodings.get(name)
+        if encoding is None:
+            encoding = self._encodings[name] = self._load_encoding(name)
+        return encoding
+
+    def _load_encoding(self, name):
+        vendored_file = os.path.join(self.encodings_dir, f"{name}.tiktoken")
+        if name in TIKTOKEN_PATTERNS and os.path.isfile(vendored_file):
+            pattern, special_tokens = TIKTOKEN_PATTERNS[name]
+            return tiktoken.Encoding(
+                name=name,
+                pat_str=pattern,
+                mergeable_ranks=_read_tiktoken_ranks(vendored_file),
+                special_tokens=special_tokens,
+            )
+        return tiktoken.get_encoding(name)
+
+    def count_tokens(self, text, model="gpt-4"):
+        """
+        Count the tokens of a text with the encoding of a model.
+        """
+        return self.encode_many([text], model)[0]
+
+    def encode_many(self, texts, model="gpt-4"):
+        """
+        Tokenize a batch of texts and return the number of tokens of each.
+
+        Texts missing from the cache are encoded together in one batch call.
+
+        Parameters
+        ----------
+        texts : iterable of str
+            The texts to tokenize.
+        model : str, optional
+            The model whose encoding to use, default is "gpt-4".
+
+        Returns
+        -------
+        counts : list of int
+            The number of tokens of each text.
+        """
+        texts = list(texts)
+        encoding = self.encoding(model)
+        keys = [
+            (encoding.name, hashlib.blake2b(text.encode(), digest_size=16).digest())
+            for text in texts
+        ]
+        counts = [self._cache.get(key) for key in keys]
+
+        missing = {}
+        for index, (key, count) in enumerate(zip(keys, counts)):
+            if count is None:
+                missing.setdefault(key, []).append(index)
+            else:
+                self._cache.move_to_end(key)
+        self.hits += len(keys) - len(missing)
+        self.misses += len(missing)
+        _count("token cache hits", len(keys) - len(missing))
+        _count("token cache misses", len(missing))
+
+        if missing:
+            with _stage("tokenization"):
+                tokens = encoding.encode_ordinary_batch([texts[indexes[0]] for indexes in missing.values()])
+            for (key, indexes), encoded in zip(missing.items(), tokens):
+                for index in indexes:
+                    counts[index] = len(encoded)
+                self._cache[key] = len(encoded)
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+        return counts
+
+    def cache_info(self):
+        """
+        Get the cache statistics: hits, misses, current size and maximum size.
+        """
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._cache), "maxsize": self.maxsize}
+
+    def clear(self):
+        self._cache.clear()
+        self.hits = self.misses = 0
+
+
+TOKEN_COUNTER = TokenCounter()
+
 
 def word_to_token_size(word, model="gpt-4"):
     """
@@ -41,17 +764,152 @@ def word_to_token_size(word, model="gpt-4"):
     ----------
     word : str
         The word to convert.
+    model : str, optional
+        The model whose tokenizer to use, default is "gpt-4".
 
     Returns
     -------
     tokens : int
         The number of tokens it would take to generate the word.
     """
-    # 1 token ~= 4 chars in English
-    return len(str(word)) / 4
+    return TOKEN_COUNTER.count_tokens(str(word), model)
+
+def _cost_from_price(price, prompt_size, tokens_per_month):
+    """
+    Calculate the cost of a model from its price record, see calculate_cost.
+    """
+    if _PROFILER is not None:
+        _PROFILER.count(f"calls: {price.name}")
+    if price.scales_with_prompt:
+        tokens_per_prompt = prompt_size_to_token_size(prompt_size)
+        tokens_per_completion = tokens_per_prompt * price.completion_multiplier
+        cost = (
+            tokens_per_month * tokens_per_prompt * price.prompt_price
+            + tokens_per_month * tokens_per_completion * price.completion_price
+        )
+    else:
+        cost = price.prompt_price * tokens_per_month
+    return cost / price.divisor
+
+
+def to_micros(dollars):
+    """
+    Convert a price in dollars to an exact whole number of micro-dollars.
+
+    Floats are converted from their shortest decimal representation, so 0.0004
+    becomes 400 and not the micro-dollar value of its nearest binary fraction.
+
+    Raises
+    ------
+    ValueError
+        If the price is not a whole number of micro-dollars.
+    """
+    micros = Fraction(repr(dollars) if isinstance(dollars, float) else dollars) * MICROS_PER_DOLLAR
+    if micros.denominator != 1:
+        raise ValueError(f"Price {dollars} is not a whole number of micro-dollars.")
+    return _check_int64(micros.numerator)
+
+
+def micros_to_decimal(micros):
+    """
+    Convert micro-dollars to an exact Decimal number of dollars.
+    """
+    return Decimal(int(micros)).scaleb(-6)
+
+
+def _check_int64(value):
+    if not -INT64_MAX - 1 <= value <= INT64_MAX:
+        raise OverflowError(f"{value} micro-dollars do not fit in int64.")
+    return value
+
+
+def _round_half_even(numerator, denominator):
+    """
+    Divide two integers and round the quotient half to even.
+    """
+    quotient, remainder = divmod(numerator, denominator)
+    if 2 * remainder > denominator or (2 * remainder == denominator and quotient % 2):
+        quotient += 1
+    return quotient
+
+
+def _micro_cost_from_price(price, prompt_size, tokens_per_month):
+    """
+    Calculate the exact cost of a model in micro-dollars from its price record, see calculate_cost.
+    """
+    if _PROFILER is not None:
+        _PROFILER.count(f"calls: {price.name}")
+    weight = Fraction(tokens_per_month)
+    if price.scales_with_prompt:
+        weight *= max(prompt_size - 1, 0)
+    cost = weight * price.micro_rate()
+    return _check_int64(_round_half_even(cost.numerator, cost.denominator))
+
+
+def _checked_multiply(a, b):
+    """
+    Multiply int64 arrays, raising OverflowError instead of wrapping around.
+    """
+    a, b = np.broadcast_arrays(np.asarray(a, dtype=np.int64), np.asarray(b, dtype=np.int64))
+    limit = np.abs(b)
+    # |a| <= INT64_MAX // |b| is the exact no-overflow condition for a, b != INT64_MIN
+    if np.any((limit != 0) & (np.abs(a) > INT64_MAX // np.maximum(limit, 1))) or np.any(
+        (a == -INT64_MAX - 1) | (b == -INT64_MAX - 1)
+    ):
+        raise OverflowError("Micro-dollar cost does not fit in int64.")
+    return a * b
+
+
+def _checked_add(a, b):
+    """
+    Add int64 arrays, raising OverflowError instead of wrapping around.
+    """
+    a = np.asarray(a, dtype=np.int64)
+    b = np.asarray(b, dtype=np.int64)
+    total = a + b
+    # The sum overflowed when both operands have the sign opposite to the result's
+    if np.any(((a ^ total) & (b ^ total)) < 0):
+        raise OverflowError("Micro-dollar cost does not fit in int64.")
+    return total
+
+
+def _round_half_even_array(numerators, denominators):
+    """
+    Vectorized _round_half_even of int64 arrays, with positive denominators.
+    """
+    quotients, remainders = np.divmod(numerators, denominators)
+    # remainders < denominators, so doubling them cannot overflow for denominators < 2**62
+    round_up = (2 * remainders > denominators) | ((2 * remainders == denominators) & (quotients % 2 == 1))
+    return _checked_add(quotients, round_up)
+
+
+def sum_micros(micros):
+    """
+    Sum micro-dollar costs exactly.
+
+    The array is summed in int64 blocks small enough not to overflow, and the block
+    sums are added as Python integers, so the total never wraps around.
+
+    Parameters
+    ----------
+    micros : array_like of int
+        The costs in micro-dollars.
+
+    Returns
+    -------
+    total : int
+        The exact sum.
+    """
+    micros = np.asarray(micros, dtype=np.int64).ravel()
+    if not len(micros):
+        return 0
+    largest = max(int(micros.max()), -int(micros.min()), 1)
+    block = max(1, INT64_MAX // largest)
+    return sum(int(micros[start:start + block].sum()) for start in range(0, len(micros), block))
+
 
 # Define functions to calculate cost
-def calculate_cost(model, prompt_size, tokens_per_month):
+def calculate_cost(model, prompt_size, tokens_per_month, pricing=None, exact=False):
     """
     Calculate the cost of using a model for a given prompt size and number of tokens per month.
 
@@ -63,79 +921,33 @@ def calculate_cost(model, prompt_size, tokens_per_month):
         The size of the prompt in k words.
         tokens_per_month : int
         The number of tokens to generate per month.
+        pricing : PricingTable, optional
+        The prices to use, default is PRICING.
+        exact : bool, optional
+        Return the cost as an exact int of micro-dollars, rounded half to even.
 
     Returns
     -------
-        cost : float
+        cost : float or int
             The cost of using the model for the given prompt size and number of tokens per month.
     Raises
     ------
         ValueError
             If the model is not supported.
+        OverflowError
+            If an exact cost does not fit in int64.
     """
-    if model == "gpt4_8k":
-        price_per_token_prompt = 0.03
-        price_per_token_completion = 0.06
-        tokens_per_prompt = word_to_token_size(generate_prompt_from_size_in_tokens(prompt_size))
-        tokens_per_completion = tokens_per_prompt
-        cost = (
-            tokens_per_month * tokens_per_prompt * price_per_token_prompt
-            + tokens_per_month * tokens_per_completion * price_per_token_completion
-        ) / 1000
-    elif model == "gpt4_32k":
-        price_per_token_prompt = 0.06
-        price_per_token_completion = 0.12
-        tokens_per_prompt = word_to_token_size(generate_prompt_from_size_in_tokens(prompt_size))
-        # GPT-4 32K has 4x the completion response tokens
-        tokens_per_completion = tokens_per_prompt * 4
-        cost = (
-            tokens_per_month * tokens_per_prompt * price_per_token_prompt
-            + tokens_per_month * tokens_per_completion * price_per_token_completion
-        ) / 1000
-    elif model == "chat_gpt":
-        price_per_token = 0.002
-        tokens_per_prompt = word_to_token_size(generate_prompt_from_size_in_tokens(prompt_size))
-        cost = tokens_per_month * tokens_per_prompt * price_per_token / 1000
-    elif model in ["ada", "babbage", "curie", "davinci"]:
-        if model == "ada":
-            price_per_training_token = 0.0004
-            price_per_usage_token = 0.0016
-        elif model == "babbage":
-            price_per_training_token = 0.0006
-            price_per_usage_token = 0.0024
-        elif model == "curie":
-            price_per_training_token = 0.0030
-            price_per_usage_token = 0.0120
-        elif model == "davinci":
-            price_per_training_token = 0.0300
-            price_per_usage_token = 0.1200
-        cost = tokens_per_month * price_per_usage_token / 1000
-    elif model == "embedding_ada":
-        price_per_token = 0.0004
-        cost = tokens_per_month * price_per_token / 1000
-    elif model == "embedding_curie":
-        price_per_token = 0.0006
-        cost = tokens_per_month * price_per_token / 1000
-    elif model == "image_1024":
-        price_per_image = 0.020
-        cost = price_per_image * tokens_per_month
-    elif model == "image_512":
-        price_per_image = 0.018
-        cost = price_per_image * tokens_per_month
-    elif model == "image_256":
-        price_per_image = 0.016
-        cost = price_per_image * tokens_per_month
-    elif model == "whisper":
-        price_per_minute = 0.006
-        cost = price_per_minute * tokens_per_month / 60
-    else:
+    price = (pricing or PRICING).get(model, vendor="openai")
+    if price is None:
         console.print("Invalid model. Please choose a valid model.", style="bold red")
         return None
-    return cost
+    if exact:
+        return _micro_cost_from_price(price, prompt_size, tokens_per_month)
+    return _cost_from_price(price, prompt_size, tokens_per_month)
 
 
 # Define functions to calculate cost for AI21 models
-def calculate_cost_ai21(model, prompt_size, tokens_per_month):
+def calculate_cost_ai21(model, prompt_size, tokens_per_month, pricing=None, exact=False):
     """
     Calculate the cost of using a model for a given prompt size and number of tokens per month.
 
@@ -147,213 +959,2457 @@ def calculate_cost_ai21(model, prompt_size, tokens_per_month):
         The size of the prompt in k words.
         tokens_per_month : int
         The number of tokens to generate per month.
+        pricing : PricingTable, optional
+        The prices to use, default is PRICING.
+        exact : bool, optional
+        Return the cost as an exact int of micro-dollars, rounded half to even.
 
     Returns
     -------
-        cost : float
+        cost : float or int
             The cost of using the model for the given prompt size and number of tokens per month.
     Raises
     ------
         ValueError
             If the model is not supported.
+        OverflowError
+            If an exact cost does not fit in int64.
     """
-
-    if model == "jumbo":
-        price_per_token = 0.015
-    elif model == "grande":
-        price_per_token = 0.01
-    elif model == "large":
-        price_per_token = 0.003
-    else:
+    price = (pricing or PRICING).get(model, vendor="ai21")
+    if price is None:
         console.print("Invalid model. Please choose a valid model.", style="bold red")
         return None
+    if exact:
+        return _micro_cost_from_price(price, prompt_size, tokens_per_month)
+    return _cost_from_price(price, prompt_size, tokens_per_month)
 
-    tokens_per_prompt = word_to_token_size(generate_prompt_from_size_in_tokens(prompt_size))
-    return tokens_per_month * tokens_per_prompt * price_per_token / 1000
 
-
-def export_cost_to_csv(file):
+def calculate_cost_grid(model_ids, prompt_sizes, tokens_per_month, models=GRID_MODELS, pricing=None, exact=False):
     """
-    Export the cost of using OpenAI and AI21 models for a given prompt size and number of messages per day to a CSV file.
+    Calculate the cost of many (model, prompt size, tokens per month) cells at once.
+
+    This is the vectorized counterpart of calculate_cost and calculate_cost_ai21: every
+    cell is priced with the same floating point operations, in the same order, so the
+    results are bit-for-bit identical to the scalar functions.
 
     Parameters
     ----------
-        None
+    model_ids : array_like of int
+        Index of each cell's model in `models`.
+    prompt_sizes : array_like of int
+        The size of the prompt of each cell.
+    tokens_per_month : array_like of int
+        The number of tokens to generate per month for each cell.
+    models : sequence of str, optional
+        The model names `model_ids` refer to, default is GRID_MODELS.
+    pricing : PricingTable, optional
+        The prices to use, default is PRICING.
+    exact : bool, optional
+        Price in exact int64 micro-dollars, rounded half to even like the scalar
+        functions with exact=True.
 
     Returns
     -------
-        None
+    costs : numpy.ndarray
+        The float64 cost, or int64 micro-dollar cost, of each cell.
+
+    Raises
+    ------
+    ValueError
+        If one of the models is not supported.
+    OverflowError
+        If an exact cost does not fit in int64.
     """
-    console.print("Exporting costs to CSV file...", style="bold magenta")
-    with open(file, "w") as csv_file:
-        csv_writer = csv.writer(csv_file)
-        csv_writer.writerow(
-            [
-                "Model",
-                "Prompt Size (k words)",
-                "Messages per Day",
-                "Tokens per Month",
-                "Cost per Month ($)",
-            ]
-        )
-        for model in [
-            "gpt4_8k",
-            "gpt4_32k",
-            "chat_gpt",
-            "ada",
-            "babbage",
-            "curie",
-            "davinci",
-            "embedding_ada",
-            "embedding_curie",
-            "image_1024",
-            "image_512",
-            "image_256",
-            "whisper",
-        ]:
-            for prompt_size, messages_per_day in itertools.product(range(LOWER_BOUND_PROMPT_SIZE, UPPER_BOUND_PROMPT_SIZE + 1), range(1, 26)):
-                tokens_per_month = messages_per_day * TOKENS_PER_MESSAGE
-                cost = calculate_cost(model, prompt_size, tokens_per_month)
-                csv_writer.writerow(
-                    [model, prompt_size, messages_per_day, tokens_per_month, cost]
-                )
-        for model in ["jumbo", "grande", "large"]:
-            for prompt_size, messages_per_day in itertools.product(range(LOWER_BOUND_PROMPT_SIZE, UPPER_BOUND_PROMPT_SIZE + 1), range(1, 26)):
-                tokens_per_month = messages_per_day * TOKENS_PER_MESSAGE
-                cost = calculate_cost_ai21(model, prompt_size, tokens_per_month)
-                csv_writer.writerow(
-                    [model, prompt_size, messages_per_day, tokens_per_month, cost]
-                )
-    console.print("Costs exported to CSV file.", style="bold green")
+    if exact:
+        return _calculate_micro_cost_grid(model_ids, prompt_sizes, tokens_per_month, models, pricing)
+    params = (pricing or PRICING).params(models)
+    model_ids = np.asarray(model_ids, dtype=np.intp)
+    prompt_sizes = np.asarray(prompt_sizes, dtype=np.int64)
+    tokens_per_month = np.asarray(tokens_per_month, dtype=np.float64)
 
-    return None
+    price_prompt, price_completion, completion_multiplier, divisor, scales = params[model_ids].T
+    with _stage("prompt generation"):
+        # Vectorized prompt_size_to_token_size: prompts are sized in closed form, not generated
+        tokens_per_prompt = np.where(scales != 0, np.maximum(prompt_sizes - 1, 0) / 4, 1.0)
+        tokens_per_completion = tokens_per_prompt * completion_multiplier
+    return (
+        tokens_per_month * tokens_per_prompt * price_prompt
+        + tokens_per_month * tokens_per_completion * price_completion
+    ) / divisor
+
+
+def _calculate_micro_cost_grid(model_ids, prompt_sizes, tokens_per_month, models, pricing):
+    params = (pricing or PRICING).micro_params(models)
+    model_ids = np.asarray(model_ids, dtype=np.intp)
+    prompt_sizes = np.asarray(prompt_sizes, dtype=np.int64)
+    tokens_per_month = np.asarray(tokens_per_month, dtype=np.int64)
 
-def export_cost_to_df(file=None):
+    numerators, denominators, scales = params[model_ids].T
+    with _stage("prompt generation"):
+        prompt_weights = np.where(scales != 0, np.maximum(prompt_sizes - 1, 0), 1)
+    weights = _checked_multiply(tokens_per_month, prompt_weights)
+    return _round_half_even_array(_checked_multiply(weights, numerators), denominators)
+
+
+def grid_columns(exact=False):
     """
-    Export the cost of using OpenAI and AI21 models for a given prompt size and number of messages per day to a Pandas DataFrame.
+    The columns of the cost grid: GRID_COLUMNS, with EXACT_COST_COLUMN costs when exact.
+    """
+    return GRID_COLUMNS[:-1] + [EXACT_COST_COLUMN] if exact else GRID_COLUMNS
+
+
+def grid_models(pricing=None):
+    """
+    List the models of a pricing table in grid order: OpenAI models, then AI21 models.
+    """
+    pricing = pricing or PRICING
+    return pricing.models("openai") + pricing.models("ai21")
+
+
+def build_cost_grid(
+    models=None,
+    prompt_sizes=range(LOWER_BOUND_PROMPT_SIZE, UPPER_BOUND_PROMPT_SIZE + 1),
+    messages_per_day=GRID_MESSAGES_PER_DAY,
+    pricing=None,
+    exact=False,
+):
+    """
+    Build the (model x prompt size x messages per day) cost grid in a handful of array operations.
+
+    Cells are ordered by model, then prompt size, then messages per day, which is the
+    row order of export_cost_to_csv and export_cost_to_df.
 
     Parameters
     ----------
-        None
+    models : sequence of str, optional
+        The models to price, default is every model of `pricing` in grid order.
+    prompt_sizes : sequence of int, optional
+        The prompt sizes to price.
+    messages_per_day : sequence of int, optional
+        The number of messages per day to price.
+    pricing : PricingTable, optional
+        The prices to use, default is PRICING.
+    exact : bool, optional
+        Price in exact int64 micro-dollars, see calculate_cost_grid.
+
     Returns
     -------
-        df : pandas.DataFrame
+    model_ids, prompt_sizes, messages_per_day, tokens_per_month, costs : numpy.ndarray
+        One array per grid column, `model_ids` indexing into `models`.
+    """
+    if models is None:
+        models = grid_models(pricing)
+    prompt_sizes = np.asarray(prompt_sizes, dtype=np.int64)
+    messages_per_day = np.asarray(messages_per_day, dtype=np.int64)
+    cells_per_model = len(prompt_sizes) * len(messages_per_day)
+
+    with _stage("grid pricing"):
+        model_ids = np.repeat(np.arange(len(models), dtype=np.intp), cells_per_model)
+        prompt_column = np.tile(np.repeat(prompt_sizes, len(messages_per_day)), len(models))
+        messages_column = np.tile(messages_per_day, len(models) * len(prompt_sizes))
+        tokens_per_month = messages_column * TOKENS_PER_MESSAGE
+        costs = calculate_cost_grid(model_ids, prompt_column, tokens_per_month, models, pricing, exact)
+    _count("cells priced", len(costs))
+    return model_ids, prompt_column, messages_column, tokens_per_month, costs
+
+
+class ScenarioComparison:
+    """
+    The cost grid of several pricing scenarios, see compare_scenarios.
+
+    Attributes
+    ----------
+    scenarios : list of str
+        The scenario names, the baseline first.
+    models : list of str
+        The models of every scenario, in grid order of first appearance.
+    prompt_sizes, messages_per_day : numpy.ndarray
+        The axes of the workload grid.
+    costs : numpy.ndarray
+        The cost of every (scenario, model, prompt size, messages per day) cell, NaN
+        where a scenario has no price for the model.
+    """
+
+    def __init__(self, scenarios, models, prompt_sizes, messages_per_day, costs):
+        self.scenarios = list(scenarios)
+        self.models = list(models)
+        self.prompt_sizes = prompt_sizes
+        self.messages_per_day = messages_per_day
+        self.costs = costs
+
+    def diff(self, scenario, baseline=None):
+        """
+        The cost change of every (model, prompt size, messages per day) cell from `baseline`
+        (default the first scenario) to `scenario`.
+        """
+        baseline = self.scenarios[0] if baseline is None else baseline
+        return self.costs[self.scenarios.index(scenario)] - self.costs[self.scenarios.index(baseline)]
+
+    def cheapest(self):
+        """
+        The index into `models` of the cheapest model of every (scenario, prompt size,
+        messages per day) cell; ties go to the model listed first.
+        """
+        return np.argmin(np.where(np.isnan(self.costs), np.inf, self.costs), axis=1)
+
+    def to_frame(self):
+        """
+        Flatten the comparison into one row per grid cell.
+
+        Returns
+        -------
+        df : pandas.DataFrame
+            The grid columns, then per scenario its "Cost per Month ($) [<scenario>]" and,
+            for scenarios other than the baseline, the "Diff ($) [<scenario>]" from it.
+        """
+        models, prompt_sizes, messages_per_day = (
+            axis.ravel()
+            for axis in np.meshgrid(
+                np.arange(len(self.models)), self.prompt_sizes, self.messages_per_day, indexing="ij"
+            )
+        )
+        columns = {
+            GRID_COLUMNS[0]: pd.Categorical.from_codes(models, categories=self.models),
+            GRID_COLUMNS[1]: prompt_sizes,
+            GRID_COLUMNS[2]: messages_per_day,
+            GRID_COLUMNS[3]: messages_per_day * TOKENS_PER_MESSAGE,
+        }
+        for scenario, costs in zip(self.scenarios, self.costs):
+            columns[f"{GRID_COLUMNS[4]} [{scenario}]"] = costs.ravel()
+        for scenario in self.scenarios[1:]:
+            columns[f"Diff ($) [{scenario}]"] = self.diff(scenario).ravel()
+        return pd.DataFrame(columns)
+
+    def cheapest_frame(self):
+        """
+        The cheapest model of every (prompt size, messages per day) cell, one column per scenario.
+        """
+        prompt_sizes, messages_per_day = (
+            axis.ravel() for axis in np.meshgrid(self.prompt_sizes, self.messages_per_day, indexing="ij")
+        )
+        columns = {GRID_COLUMNS[1]: prompt_sizes, GRID_COLUMNS[2]: messages_per_day}
+        for scenario, cheapest in zip(self.scenarios, self.cheapest()):
+            columns[f"Cheapest Model [{scenario}]"] = pd.Categorical.from_codes(cheapest.ravel(), categories=self.models)
+        return pd.DataFrame(columns)
+
+
+def compare_scenarios(
+    scenarios,
+    models=None,
+    prompt_sizes=range(LOWER_BOUND_PROMPT_SIZE, UPPER_BOUND_PROMPT_SIZE + 1),
+    messages_per_day=GRID_MESSAGES_PER_DAY,
+):
+    """
+    Price one workload grid under several pricing sheets in a single vectorized pass.
+
+    The token volumes of the grid are computed once and shared by every scenario, and
+    each cell is priced with the operations of calculate_cost_grid, so the costs of a
+    scenario are bit-for-bit identical to build_cost_grid with its pricing table.
+
+    Parameters
+    ----------
+    scenarios : mapping of str to PricingTable or str
+        The pricing tables, or the paths of price sheets, by scenario name; the first
+        one is the baseline of the diffs.
+    models : sequence of str, optional
+        The models to compare, default is the models of every scenario, in grid order.
+    prompt_sizes : sequence of int, optional
+        The prompt sizes of the workload.
+    messages_per_day : sequence of int, optional
+        The number of messages per day of the workload.
+
+    Returns
+    -------
+    comparison : ScenarioComparison
+        The (scenario x model x prompt size x messages per day) cost matrix.
+
+    Raises
+    ------
+    ValueError
+        If no scenario is given, or a model is in none of the scenarios.
+    """
+    if not scenarios:
+        raise ValueError("No pricing scenario to compare.")
+    tables = {
+        name: load_pricing(pricing) if isinstance(pricing, (str, os.PathLike)) else pricing
+        for name, pricing in scenarios.items()
+    }
+    if models is None:
+        models = list(dict.fromkeys(model for pricing in tables.values() for model in grid_models(pricing)))
+    unknown = [model for model in models if not any(model in pricing for pricing in tables.values())]
+    if unknown:
+        raise ValueError(f"Invalid model(s): {', '.join(unknown)}")
+
+    # (scenario, model) price rows, NaN where a scenario does not price a model
+    params = np.full((len(tables), len(models), 5), np.nan)
+    for index, pricing in enumerate(tables.values()):
+        present = [position for position, model in enumerate(models) if model in pricing]
+        params[index, present] = pricing.params([models[position] for position in present])
+    price_prompt, price_completion, completion_multiplier, divisor, scales = (
+        params[..., column, None, None] for column in range(5)
+    )
+
+    prompt_sizes = np.asarray(prompt_sizes, dtype=np.int64)
+    messages_per_day = np.asarray(messages_per_day, dtype=np.int64)
+    with _stage("scenario pricing"):
+        # Token volumes shared by every scenario and model
+        tokens_per_month = (messages_per_day * TOKENS_PER_MESSAGE).astype(np.float64)
+        tokens_per_prompt = np.maximum(prompt_sizes - 1, 0) / 4
+        scaling_volume = tokens_per_month * tokens_per_prompt[:, None]
+        flat_volume = tokens_per_month * 1.0
+        scaling = scales != 0
+
+        tokens_per_completion = np.where(scaling, tokens_per_prompt[:, None], 1.0) * completion_multiplier
+        costs = (
+            np.where(scaling, scaling_volume, flat_volume) * price_prompt
+            + tokens_per_month * tokens_per_completion * price_completion
+        ) / divisor
+    _count("cells priced", costs.size)
+    return ScenarioComparison(tables, models, prompt_sizes, messages_per_day, costs)
+
+
+class CostIndex:
+    """
+    Dense, array-backed index of the cost grid for repeated lookups.
+
+    The costs of export_cost_to_df are held as one (prompt size x messages per day)
+    array per model, so a point lookup is an array index and a range of prompt sizes
+    or messages per day is an array slice, without scanning or filtering the grid.
+    Saved indexes are memory-mapped by load, so worker processes loading the same file
+    share one copy through the page cache.
+
+    Parameters
+    ----------
+    models : sequence of str
+        The models of the index.
+    first_prompt_size : int
+        The prompt size of the first column of the prompt size axis.
+    first_messages_per_day : int
+        The number of messages per day of the first column of the messages axis.
+    costs : numpy.ndarray
+        The (model x prompt size x messages per day) costs, float64 or, for an exact
+        index, int64 micro-dollars.
+    """
+
+    def __init__(self, models, first_prompt_size, first_messages_per_day, costs):
+        self.models = list(models)
+        self.first_prompt_size = int(first_prompt_size)
+        self.first_messages_per_day = int(first_messages_per_day)
+        self.costs = costs
+        self._model_index = {model: index for index, model in enumerate(self.models)}
+
+    @classmethod
+    def build(
+        cls,
+        pricing=None,
+        models=None,
+        prompt_sizes=range(LOWER_BOUND_PROMPT_SIZE, UPPER_BOUND_PROMPT_SIZE + 1),
+        messages_per_day=GRID_MESSAGES_PER_DAY,
+        exact=False,
+    ):
+        """
+        Price the grid with build_cost_grid and index it; the costs are identical to export_cost_to_df.
+
+        `prompt_sizes` and `messages_per_day` are ranges with a step of 1.
+        """
+        if prompt_sizes.step != 1 or messages_per_day.step != 1:
+            raise ValueError("A cost index needs contiguous prompt sizes and messages per day.")
+        models = grid_models(pricing) if models is None else list(models)
+        costs = build_cost_grid(models, prompt_sizes, messages_per_day, pricing, exact)[-1]
+        return cls(
+            models,
+            prompt_sizes.start,
+            messages_per_day.start,
+            costs.reshape(len(models), len(prompt_sizes), len(messages_per_day)),
+        )
+
+    def save(self, file):
+        """
+        Save the index as an uncompressed NPZ file, which load memory-maps.
+        """
+        np.savez(
+            file,
+            models=np.array(self.models),
+            axes=np.array([self.first_prompt_size, self.first_messages_per_day], dtype=np.int64),
+            costs=np.ascontiguousarray(self.costs),
+        )
+
+    @classmethod
+    def load(cls, file):
+        """
+        Load a saved index, memory-mapping its costs.
+        """
+        first_prompt_size, first_messages_per_day = _npz_member(file, "axes").tolist()
+        return cls(_npz_member(file, "models").tolist(), first_prompt_size, first_messages_per_day, _npz_member(file, "costs"))
+
+    @property
+    def prompt_sizes(self):
+        return range(self.first_prompt_size, self.first_prompt_size + self.costs.shape[1])
+
+    @property
+    def messages_per_day(self):
+        return range(self.first_messages_per_day, self.first_messages_per_day + self.costs.shape[2])
+
+    def cost(self, model, prompt_size, messages_per_day):
+        """
+        Look up the cost of one grid cell in O(1).
+
+        Raises
+        ------
+        ValueError
+            If the model, prompt size or messages per day is not in the index.
+        """
+        return self.costs[
+            self._model(model),
+            _axis_position(self.prompt_sizes, prompt_size, "Prompt size"),
+            _axis_position(self.messages_per_day, messages_per_day, "Messages per day"),
+        ].item()
+
+    def costs_in_range(self, model, prompt_sizes=None, messages_per_day=None):
+        """
+        Look up the costs of a model over ranges of prompt sizes and messages per day in O(range).
+
+        Parameters
+        ----------
+        model : str
+            The model.
+        prompt_sizes : tuple of int, optional
+            An inclusive (first, last) range of prompt sizes, default is all.
+        messages_per_day : int or tuple of int, optional
+            A number of messages per day, or an inclusive (first, last) range of them,
+            default is all.
+
+        Returns
+        -------
+        costs : numpy.ndarray
+            A read-only view of the costs: 1-D over prompt sizes when a single number of
+            messages per day is given, (prompt sizes x messages per day) otherwise.
+        """
+        if messages_per_day is None or isinstance(messages_per_day, tuple):
+            messages = _axis_slice(self.messages_per_day, messages_per_day, "Messages per day")
+        else:
+            messages = _axis_position(self.messages_per_day, messages_per_day, "Messages per day")
+        costs = self.costs[
+            self._model(model), _axis_slice(self.prompt_sizes, prompt_sizes, "Prompt size"), messages
+        ].view()
+        costs.flags.writeable = False
+        return costs
+
+    def min(self, model, prompt_sizes=None, messages_per_day=None):
+        """
+        Find the cheapest cell of a range, see costs_in_range.
+
+        Returns
+        -------
+        cost, prompt_size, messages_per_day : tuple
+            The smallest cost and its cell; ties go to the smallest prompt size, then
+            the fewest messages per day.
+        """
+        return self._extremum(np.argmin, model, prompt_sizes, messages_per_day)
+
+    def max(self, model, prompt_sizes=None, messages_per_day=None):
+        """
+        Find the most expensive cell of a range, see min.
+        """
+        return self._extremum(np.argmax, model, prompt_sizes, messages_per_day)
+
+    def _extremum(self, arg, model, prompt_sizes, messages_per_day):
+        prompt_slice = _axis_slice(self.prompt_sizes, prompt_sizes, "Prompt size")
+        messages_slice = _axis_slice(self.messages_per_day, messages_per_day, "Messages per day")
+        costs = self.costs[self._model(model), prompt_slice, messages_slice]
+        if not costs.size:
+            raise ValueError("Empty range.")
+        prompt_offset, messages_offset = np.unravel_index(arg(costs), costs.shape)
+        return (
+            costs[prompt_offset, messages_offset].item(),
+            self.prompt_sizes[prompt_slice][prompt_offset],
+            self.messages_per_day[messages_slice][messages_offset],
+        )
+
+    def _model(self, model):
+        index = self._model_index.get(model)
+        if index is None:
+            raise ValueError(f"Model not in the index: {model}")
+        return index
+
+
+def _axis_position(axis, value, name):
+    if value not in axis:
+        raise ValueError(f"{name} {value} is not in the index, which covers {axis.start}..{axis.stop - 1}.")
+    return value - axis.start
+
+
+def _axis_slice(axis, selection, name):
+    """
+    Turn an inclusive (first, last) range of an index axis into a slice, or a single
+    value into a 1-wide slice.
+    """
+    if selection is None:
+        return slice(None)
+    if isinstance(selection, tuple):
+        first, last = selection
+        return slice(_axis_position(axis, first, name), _axis_position(axis, last, name) + 1)
+    return slice(_axis_position(axis, selection, name), _axis_position(axis, selection, name) + 1)
+
+
+class CostFrameBuilder:
+    """
+    Columnar builder for the cost grid DataFrame.
+
+    The typed column arrays are preallocated once for `rows` cells and filled in
+    blocks, and the DataFrame is created a single time by `build`, instead of being
+    copied on every appended row.
+
+    Parameters
+    ----------
+    rows : int
+        The number of rows of the resulting DataFrame.
+    models : sequence of str, optional
+        The categories of the model column, default is GRID_MODELS.
+    exact : bool, optional
+        Hold int64 micro-dollar costs, in an EXACT_COST_COLUMN column.
+    """
+
+    def __init__(self, rows, models=GRID_MODELS, exact=False):
+        self.models = list(models)
+        self.rows = rows
+        self.filled = 0
+        self.model_codes = np.empty(rows, dtype=np.int8 if len(self.models) < 128 else np.int32)
+        self.prompt_sizes = np.empty(rows, dtype=np.int32)
+        self.messages_per_day = np.empty(rows, dtype=np.int32)
+        self.tokens_per_month = np.empty(rows, dtype=np.int64)
+        self.costs = np.empty(rows, dtype=np.int64 if exact else np.float64)
+        self.columns = grid_columns(exact)
+
+    def add(self, model_ids, prompt_sizes, messages_per_day, tokens_per_month, costs):
+        """
+        Copy a block of grid cells into the next free rows.
+
+        Parameters
+        ----------
+        model_ids, prompt_sizes, messages_per_day, tokens_per_month, costs : array_like
+            The columns of the block, as returned by build_cost_grid.
+        """
+        start = self.filled
+        stop = start + len(costs)
+        if stop > self.rows:
+            raise ValueError(f"Builder holds {self.rows} rows, cannot add {stop - self.rows} more.")
+        self.model_codes[start:stop] = model_ids
+        self.prompt_sizes[start:stop] = prompt_sizes
+        self.messages_per_day[start:stop] = messages_per_day
+        self.tokens_per_month[start:stop] = tokens_per_month
+        self.costs[start:stop] = costs
+        self.filled = stop
+
+    def build(self):
+        """
+        Create the DataFrame from the filled rows.
+
+        Returns
+        -------
+        df : pandas.DataFrame
+            The cost grid, with a categorical model column.
+        """
+        n = self.filled
+        return pd.DataFrame(
+            {
+                "Model": pd.Categorical.from_codes(self.model_codes[:n], categories=self.models),
+                "Prompt Size (k words)": self.prompt_sizes[:n],
+                "Messages per Day": self.messages_per_day[:n],
+                "Tokens per Month": self.tokens_per_month[:n],
+                self.columns[-1]: self.costs[:n],
+            },
+            columns=self.columns,
+            copy=False,
+        )
+
+
+def grid_chunks(
+    models,
+    lower_bound_prompt_size=LOWER_BOUND_PROMPT_SIZE,
+    upper_bound_prompt_size=UPPER_BOUND_PROMPT_SIZE,
+    messages_per_day=GRID_MESSAGES_PER_DAY,
+    chunk_rows=EXPORT_CHUNK_ROWS,
+):
+    """
+    Split the cost grid into chunks of about `chunk_rows` rows, in export row order.
+
+    Yields
+    ------
+    model, first_prompt_size, last_prompt_size : tuple
+        One chunk: a model and an inclusive range of prompt sizes.
+    """
+    sizes_per_chunk = max(1, chunk_rows // max(1, len(messages_per_day)))
+    for model in models:
+        for first in range(lower_bound_prompt_size, upper_bound_prompt_size + 1, sizes_per_chunk):
+            yield model, first, min(first + sizes_per_chunk - 1, upper_bound_prompt_size)
+
+
+def _cost_grid_csv_chunk(chunk, pricing=None, messages_per_day=GRID_MESSAGES_PER_DAY, exact=False):
+    """
+    Price one grid chunk and format it as CSV rows; runs in export worker processes.
+    """
+    model, first, last = chunk
+    _, prompt_sizes, messages, tokens_per_month, costs = build_cost_grid(
+        [model], range(first, last + 1), messages_per_day, pricing, exact
+    )
+    with _stage("csv formatting"):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(
+            zip(
+                itertools.repeat(model),
+                prompt_sizes.tolist(),
+                messages.tolist(),
+                tokens_per_month.tolist(),
+                costs.tolist(),
+            )
+        )
+        return buffer.getvalue()
+
+
+def _write_rows(csv_file, rows):
+    """
+    Write formatted CSV rows, counting the rows and bytes written when profiling.
+    """
+    with _stage("row writing"):
+        csv_file.write(rows)
+    if _PROFILER is not None:
+        _PROFILER.count("rows written", rows.count(b"\n" if isinstance(rows, bytes) else "\n"))
+        _PROFILER.count("bytes flushed", len(rows))
+
+
+def export_cost_to_csv(
+    file,
+    pricing=None,
+    lower_bound_prompt_size=LOWER_BOUND_PROMPT_SIZE,
+    upper_bound_prompt_size=UPPER_BOUND_PROMPT_SIZE,
+    workers=1,
+    exact=False,
+    resume=True,
+):
+    """
+    Export the cost of using OpenAI and AI21 models for a given prompt size and number of messages per day to a CSV file.
+
+    The grid is priced in chunks; with several workers the chunks are priced in a
+    process pool and written in grid order, so the file is byte-identical to a serial run.
+
+    Memory is bounded by a few chunks per worker whatever the size of the grid, see
+    EXPORT_CHUNKS_PER_WORKER. Chunks are written
+    to `file`.partial, and after each chunk the progress is checkpointed to
+    `file`.checkpoint; the partial file is renamed to `file` once complete, so `file`
+    is never left half-written. An interrupted export resumes after its last
+    checkpointed chunk, unless its inputs changed.
+
+    Parameters
+    ----------
+        file : str
+            The path of the CSV file to write.
+        pricing : PricingTable, optional
+            The prices to use, default is PRICING.
+        lower_bound_prompt_size : int, optional
+            The smallest prompt size of the grid.
+        upper_bound_prompt_size : int, optional
+            The largest prompt size of the grid.
+        workers : int, optional
+            The number of worker processes, default is 1 (serial).
+        exact : bool, optional
+            Export int64 micro-dollar costs, see calculate_cost_grid.
+        resume : bool, optional
+            Resume an interrupted export of the same grid, default is True.
+
+    Returns
+    -------
+        None
+    """
+    console.print("Exporting costs to CSV file...", style="bold magenta")
+    pricing = pricing or PRICING
+    partial_file = os.fspath(file) + ".partial"
+    checkpoint_file = os.fspath(file) + ".checkpoint"
+    inputs = {
+        "fingerprint": pricing.fingerprint,
+        "lower": lower_bound_prompt_size,
+        "upper": upper_bound_prompt_size,
+        "messages_per_day": [GRID_MESSAGES_PER_DAY.start, GRID_MESSAGES_PER_DAY.stop],
+        "tokens_per_message": TOKENS_PER_MESSAGE,
+        "chunk_rows": EXPORT_CHUNK_ROWS,
+        "exact": exact,
+    }
+    checkpoint = _read_export_checkpoint(checkpoint_file, inputs) if resume and os.path.exists(partial_file) else None
+
+    chunks = grid_chunks(
+        grid_models(pricing), lower_bound_prompt_size, upper_bound_prompt_size, chunk_rows=inputs["chunk_rows"]
+    )
+    price_chunk = functools.partial(_cost_grid_csv_chunk, pricing=pricing, exact=exact)
+    with open(partial_file, "wb" if checkpoint is None else "r+b", buffering=EXPORT_BUFFER_SIZE) as csv_file:
+        if checkpoint is None:
+            written = 0
+            header = io.StringIO()
+            csv.writer(header).writerow(grid_columns(exact))
+            csv_file.write(header.getvalue().encode())
+        else:
+            written = checkpoint["chunks"]
+            # Drop whatever was written after the last checkpoint
+            csv_file.truncate(checkpoint["offset"])
+            csv_file.seek(checkpoint["offset"])
+            chunks = itertools.islice(chunks, written, None)
+            console.print(f"Resuming the export after {written} chunks.")
+
+        def write(rows):
+            nonlocal written
+            _write_rows(csv_file, rows.encode())
+            written += 1
+            _write_export_checkpoint(csv_file, checkpoint_file, inputs, written)
+
+        if workers > 1:
+            from concurrent.futures import ProcessPoolExecutor
+
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                for rows in _bounded_map(executor, price_chunk, chunks, workers * EXPORT_CHUNKS_PER_WORKER):
+                    write(rows)
+        else:
+            for rows in map(price_chunk, chunks):
+                write(rows)
+        csv_file.flush()
+        os.fsync(csv_file.fileno())
+    os.replace(partial_file, file)
+    if os.path.exists(checkpoint_file):
+        os.remove(checkpoint_file)
+    console.print("Costs exported to CSV file.", style="bold green")
+
+    return None
+
+
+def _bounded_map(executor, function, iterable, window):
+    """
+    Like executor.map, but with at most `window` calls submitted and not yet consumed.
+
+    executor.map submits every call up front, so the results of a large grid would pile
+    up in memory while they wait to be written. The results are yielded in submission
+    order, whatever order the workers finish in.
+    """
+    futures = deque()
+    try:
+        for item in iterable:
+            if len(futures) >= window:
+                yield futures.popleft().result()
+            futures.append(executor.submit(function, item))
+        while futures:
+            yield futures.popleft().result()
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def _read_export_checkpoint(checkpoint_file, inputs):
+    """
+    Read the checkpoint of an interrupted export, or None if there is none for these inputs.
+    """
+    try:
+        with open(checkpoint_file) as f:
+            checkpoint = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    return checkpoint if checkpoint.get("inputs") == inputs else None
+
+
+def _write_export_checkpoint(csv_file, checkpoint_file, inputs, chunks):
+    # The rows must be on disk before the checkpoint that vouches for them
+    with _stage("checkpointing"):
+        csv_file.flush()
+        os.fsync(csv_file.fileno())
+        with open(checkpoint_file + ".tmp", "w") as f:
+            json.dump({"inputs": inputs, "chunks": chunks, "offset": csv_file.tell()}, f)
+        os.replace(checkpoint_file + ".tmp", checkpoint_file)
+
+def _partition_inputs(price, messages_per_day, exact=False):
+    """
+    The inputs a model partition depends on, besides its prompt size range.
+    """
+    return {
+        "price": price.as_dict(),
+        "formula_version": COST_FORMULA_VERSION,
+        "tokens_per_message": TOKENS_PER_MESSAGE,
+        "messages_per_day": [messages_per_day.start, messages_per_day.stop],
+        "exact": exact,
+    }
+
+
+def export_cost_partitions(
+    directory,
+    pricing=None,
+    lower_bound_prompt_size=LOWER_BOUND_PROMPT_SIZE,
+    upper_bound_prompt_size=UPPER_BOUND_PROMPT_SIZE,
+    exact=False,
+):
+    """
+    Incrementally export the cost grid as one CSV partition per model.
+
+    A manifest records the prices and prompt size range each partition was computed
+    with. On the next run, partitions whose inputs did not change are left untouched, a
+    changed price rewrites only that model's partition, and a changed prompt size range
+    only computes the new prompt sizes: rows of prompt sizes that are still in range are
+    copied, not recomputed, and a range extended upwards is appended in place. The
+    manifest is kept in step with every partition, so rows appended by an interrupted
+    run are truncated away instead of being appended twice.
+
+    Parameters
+    ----------
+    directory : str
+        The directory of the partitions (<model>.csv) and of PARTITION_MANIFEST.
+    pricing : PricingTable, optional
+        The prices to use, default is PRICING.
+    lower_bound_prompt_size : int, optional
+        The smallest prompt size of the grid.
+    upper_bound_prompt_size : int, optional
+        The largest prompt size of the grid.
+    exact : bool, optional
+        Export int64 micro-dollar costs, see calculate_cost_grid.
+
+    Returns
+    -------
+    actions : dict
+        What was done to each partition: "unchanged", "written", "appended",
+        "updated" (rows copied and new prompt sizes computed) or "removed".
+    """
+    pricing = pricing or PRICING
+    messages_per_day = GRID_MESSAGES_PER_DAY
+    os.makedirs(directory, exist_ok=True)
+    manifest_file = os.path.join(directory, PARTITION_MANIFEST)
+    try:
+        with open(manifest_file) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        manifest = {"partitions": {}}
+    previous = manifest["partitions"]
+
+    # The manifest is saved after every partition that changes, so an interrupted run
+    # leaves it describing what is on disk: a rewritten partition loses its entry before
+    # it is replaced, and an appended one gets its new range and size once the rows are synced
+    partitions = dict(previous)
+
+    def save_manifest():
+        manifest = {"columns": grid_columns(exact), "pricing_version": pricing.version, "partitions": partitions}
+        with open(manifest_file + ".tmp", "w") as f:
+            json.dump(manifest, f, indent=4)
+        os.replace(manifest_file + ".tmp", manifest_file)
+
+    def rewrite(model, file, parts):
+        if partitions.pop(model, None) is not None:
+            save_manifest()
+        _write_partition(file, parts, exact)
+
+    actions = {}
+    models = grid_models(pricing)
+    for model in models:
+        inputs = _partition_inputs(pricing[model], messages_per_day, exact)
+        file = os.path.join(directory, f"{model}.csv")
+        old = previous.get(model)
+        price_chunk = functools.partial(
+            _cost_grid_csv_chunk, pricing=pricing, messages_per_day=messages_per_day, exact=exact
+        )
+
+        reusable = (
+            old is not None
+            and "size" in old
+            and os.path.isfile(file)
+            and os.path.getsize(file) >= old["size"]
+            and all(old.get(key) == value for key, value in inputs.items())
+        )
+        if reusable and os.path.getsize(file) > old["size"]:
+            # Rows appended by an interrupted run that did not get to record them
+            os.truncate(file, old["size"])
+        first_kept = max(lower_bound_prompt_size, old["lower"]) if reusable else 0
+        last_kept = min(upper_bound_prompt_size, old["upper"]) if reusable else -1
+        if first_kept > last_kept:
+            # Nothing reusable: (re)compute the whole partition
+            rewrite(
+                model,
+                file,
+                [price_chunk((model, lower_bound_prompt_size, upper_bound_prompt_size))]
+                if lower_bound_prompt_size <= upper_bound_prompt_size
+                else [],
+            )
+            actions[model] = "written"
+        elif (old["lower"], old["upper"]) == (lower_bound_prompt_size, upper_bound_prompt_size):
+            actions[model] = "unchanged"
+            continue
+        elif old["lower"] == lower_bound_prompt_size and old["upper"] < upper_bound_prompt_size:
+            with open(file, "a", newline="", buffering=EXPORT_BUFFER_SIZE) as csv_file:
+                _write_rows(csv_file, price_chunk((model, old["upper"] + 1, upper_bound_prompt_size)))
+                csv_file.flush()
+                os.fsync(csv_file.fileno())
+            actions[model] = "appended"
+        else:
+            rows_per_size = len(messages_per_day)
+            skip = (first_kept - old["lower"]) * rows_per_size
+            keep = (last_kept - first_kept + 1) * rows_per_size
+            with open(file, newline="") as old_file:
+                next(old_file)  # header
+                kept_rows = "".join(itertools.islice(old_file, skip, skip + keep))
+            parts = []
+            if lower_bound_prompt_size < first_kept:
+                parts.append(price_chunk((model, lower_bound_prompt_size, first_kept - 1)))
+            parts.append(kept_rows)
+            if last_kept < upper_bound_prompt_size:
+                parts.append(price_chunk((model, last_kept + 1, upper_bound_prompt_size)))
+            rewrite(model, file, parts)
+            actions[model] = "updated"
+        partitions[model] = dict(
+            inputs, lower=lower_bound_prompt_size, upper=upper_bound_prompt_size, size=os.path.getsize(file)
+        )
+        save_manifest()
+
+    for model in previous.keys() - set(models):
+        file = os.path.join(directory, f"{model}.csv")
+        del partitions[model]
+        save_manifest()
+        if os.path.exists(file):
+            os.remove(file)
+        actions[model] = "removed"
+
+    save_manifest()
+    return actions
+
+
+def _write_partition(file, parts, exact=False):
+    # Write next to the partition and rename, so an interrupted run never leaves a half-written partition
+    with open(file + ".tmp", "w", newline="", buffering=EXPORT_BUFFER_SIZE) as csv_file:
+        csv.writer(csv_file).writerow(grid_columns(exact))
+        for part in parts:
+            _write_rows(csv_file, part)
+    os.replace(file + ".tmp", file)
+
+
+def export_cost_to_df(file=None, pricing=None, format="csv", compression=None, exact=False):
+    """
+    Export the cost of using OpenAI and AI21 models for a given prompt size and number of messages per day to a Pandas DataFrame.
+
+    Parameters
+    ----------
+        file : str, optional
+            If given, the DataFrame is also written to this file.
+        pricing : PricingTable, optional
+            The prices to use, default is PRICING.
+        format : str, optional
+            The format of `file`, one of EXPORT_FORMATS, default is "csv".
+        compression : str, optional
+            The compression codec of columnar formats, see export_cost_to_columnar.
+        exact : bool, optional
+            Hold int64 micro-dollar costs, see calculate_cost_grid.
+    Returns
+    -------
+        df : pandas.DataFrame
             The DataFrame containing the cost of using OpenAI and AI21 models for a given prompt size and number of messages per day.
+
+    Raises
+    ------
+        ValueError
+            If `format` is not one of EXPORT_FORMATS.
+    """
+    if file and format != "csv":
+        format = _columnar_format(file, format)
+    models = grid_models(pricing)
+    grid = build_cost_grid(models, pricing=pricing, exact=exact)
+    with _stage("dataframe building"):
+        builder = CostFrameBuilder(len(grid[-1]), models, exact)
+        builder.add(*grid)
+        df = builder.build()
+
+    console.print("Costs exported to DataFrame.", style="bold green")
+    if file:
+        _count("rows written", len(df))
+    if file and format == "csv":
+        with _stage("row writing"):
+            df.to_csv(file, index=False)
+    elif file:
+        _write_columnar(
+            file,
+            format,
+            models,
+            builder.model_codes,
+            builder.prompt_sizes,
+            builder.messages_per_day,
+            builder.tokens_per_month,
+            builder.costs,
+            compression,
+        )
+    return df
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+    except ImportError as error:
+        raise ImportError("Parquet and Arrow exports require pyarrow: pip install pyarrow") from error
+    return pyarrow
+
+
+def _columnar_format(file, format=None):
+    if format is None:
+        format = COLUMNAR_EXTENSIONS.get(os.path.splitext(file)[1].lower())
+    if format not in COLUMNAR_FORMATS:
+        raise ValueError(f"Unsupported columnar format {format!r} for {file}, choose one of {', '.join(COLUMNAR_FORMATS)}.")
+    return format
+
+
+def _write_columnar(
+    file, format, models, model_codes, prompt_sizes, messages_per_day, tokens_per_month, costs, compression=None
+):
+    """
+    Write grid columns, sorted by model, as Parquet, Arrow IPC or NPZ.
+
+    Every model is stored as its own contiguous block (a Parquet row group, an Arrow
+    record batch, a slice of the NPZ arrays) so readers can load a single model.
+    Integer costs are stored as int64 micro-dollars in an EXACT_COST_COLUMN column.
+    """
+    with _stage("columnar writing"):
+        _write_columnar_blocks(
+            file, format, models, model_codes, prompt_sizes, messages_per_day, tokens_per_month, costs, compression
+        )
+
+
+def _write_columnar_blocks(
+    file, format, models, model_codes, prompt_sizes, messages_per_day, tokens_per_month, costs, compression
+):
+    format = _columnar_format(file, format)
+    model_codes = np.asarray(model_codes, dtype=np.int8 if len(models) < 128 else np.int32)
+    prompt_sizes = np.asarray(prompt_sizes, dtype=np.int32)
+    messages_per_day = np.asarray(messages_per_day, dtype=np.int32)
+    tokens_per_month = np.asarray(tokens_per_month, dtype=np.int64)
+    exact = np.issubdtype(np.asarray(costs).dtype, np.integer)
+    costs = np.asarray(costs, dtype=np.int64 if exact else np.float64)
+    offsets = np.searchsorted(model_codes, np.arange(len(models) + 1))
+
+    if format == "npz":
+        save = np.savez_compressed if compression else np.savez
+        save(
+            file,
+            models=np.array(models),
+            model_offsets=offsets,
+            model_codes=model_codes,
+            prompt_sizes=prompt_sizes,
+            messages_per_day=messages_per_day,
+            tokens_per_month=tokens_per_month,
+            costs=costs,
+        )
+        return
+
+    pa = _import_pyarrow()
+    dictionary = pa.array(models, type=pa.string())
+    schema = pa.schema(
+        [
+            (GRID_COLUMNS[0], pa.dictionary(pa.from_numpy_dtype(model_codes.dtype), pa.string())),
+            (GRID_COLUMNS[1], pa.int32()),
+            (GRID_COLUMNS[2], pa.int32()),
+            (GRID_COLUMNS[3], pa.int64()),
+            (EXACT_COST_COLUMN, pa.int64()) if exact else (GRID_COLUMNS[4], pa.float64()),
+        ],
+        metadata={"models": json.dumps(list(models))},
+    )
+    batches = (
+        pa.record_batch(
+            [
+                pa.DictionaryArray.from_arrays(model_codes[start:stop], dictionary),
+                prompt_sizes[start:stop],
+                messages_per_day[start:stop],
+                tokens_per_month[start:stop],
+                costs[start:stop],
+            ],
+            schema=schema,
+        )
+        for start, stop in zip(offsets[:-1], offsets[1:])
+    )
+    if format == "parquet":
+        import pyarrow.parquet as pq
+
+        with pq.ParquetWriter(file, schema, compression=compression or "none") as writer:
+            for batch in batches:
+                writer.write_batch(batch, row_group_size=max(1, batch.num_rows))
+    elif format == "arrow":
+        import pyarrow.ipc
+
+        # Uncompressed Arrow files can be memory-mapped without copies
+        options = pa.ipc.IpcWriteOptions(compression=compression)
+        with pa.OSFile(file, "wb") as sink, pa.ipc.new_file(sink, schema, options=options) as writer:
+            for batch in batches:
+                writer.write_batch(batch)
+
+
+def export_cost_to_columnar(
+    file,
+    format=None,
+    pricing=None,
+    lower_bound_prompt_size=LOWER_BOUND_PROMPT_SIZE,
+    upper_bound_prompt_size=UPPER_BOUND_PROMPT_SIZE,
+    compression=None,
+    exact=False,
+):
+    """
+    Export the cost grid to a columnar binary file: Parquet, Arrow IPC or NPZ.
+
+    Model names are dictionary-encoded and the numeric columns are typed (int32 prompt
+    size and messages per day, int64 tokens per month, float64 cost). Use
+    read_cost_grid to load one model or a range of prompt sizes back.
+
+    Parameters
+    ----------
+    file : str
+        The path of the file to write.
+    format : str, optional
+        One of COLUMNAR_FORMATS, default is taken from the file extension
+        (.parquet, .arrow / .feather, .npz).
+    pricing : PricingTable, optional
+        The prices to use, default is PRICING.
+    lower_bound_prompt_size : int, optional
+        The smallest prompt size of the grid.
+    upper_bound_prompt_size : int, optional
+        The largest prompt size of the grid.
+    compression : str, optional
+        The codec: "snappy", "zstd", "gzip"... for Parquet, "zstd" or "lz4" for Arrow,
+        any value to deflate NPZ; default is uncompressed.
+    exact : bool, optional
+        Export int64 micro-dollar costs, see calculate_cost_grid.
+
+    Returns
+    -------
+        None
+    """
+    format = _columnar_format(file, format)
+    console.print(f"Exporting costs to {format} file...", style="bold magenta")
+    models = grid_models(pricing)
+    grid = build_cost_grid(
+        models, range(lower_bound_prompt_size, upper_bound_prompt_size + 1), pricing=pricing, exact=exact
+    )
+    _write_columnar(file, format, models, *grid, compression=compression)
+    _count("rows written", len(grid[-1]))
+    console.print(f"Costs exported to {format} file.", style="bold green")
+
+    return None
+
+
+def _npz_member(file, name):
+    """
+    Open an array of an NPZ file, memory-mapped when it is stored uncompressed.
+    """
+    with zipfile.ZipFile(file) as archive:
+        info = archive.getinfo(f"{name}.npy")
+        if info.compress_type != zipfile.ZIP_STORED:
+            with archive.open(info) as member:
+                return np.lib.format.read_array(member)
+    with open(file, "rb") as f:
+        # Skip the zip local file header to reach the .npy payload
+        f.seek(info.header_offset + 26)
+        name_length, extra_length = struct.unpack("<HH", f.read(4))
+        f.seek(info.header_offset + 30 + name_length + extra_length)
+        if np.lib.format.read_magic(f) == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+    if not shape or 0 in shape:
+        return np.zeros(shape, dtype=dtype)
+    return np.memmap(file, dtype=dtype, mode="r", offset=offset, shape=shape, order="F" if fortran_order else "C")
+
+
+def read_cost_grid(file, models=None, prompt_sizes=None, format=None):
+    """
+    Read a cost grid exported by export_cost_to_columnar, without parsing the whole file.
+
+    Only the blocks of the requested models are read; Arrow and uncompressed NPZ files
+    are memory-mapped.
+
+    Parameters
+    ----------
+    file : str
+        The path of the Parquet, Arrow or NPZ file.
+    models : sequence of str, optional
+        The models to read, default is all of them.
+    prompt_sizes : tuple of int, optional
+        An inclusive (first, last) range of prompt sizes to read, default is all.
+    format : str, optional
+        One of COLUMNAR_FORMATS, default is taken from the file extension.
+
+    Returns
+    -------
+    df : pandas.DataFrame
+        The selected rows, with the columns of export_cost_to_df (exact or not).
+    """
+    format = _columnar_format(file, format)
+    if format == "parquet":
+        _import_pyarrow()
+        import pyarrow.parquet as pq
+
+        filters = []
+        if models is not None:
+            _model_indexes(json.loads(pq.read_schema(file).metadata[b"models"]), models)
+            filters.append((GRID_COLUMNS[0], "in", list(models)))
+        if prompt_sizes is not None:
+            filters.append((GRID_COLUMNS[1], ">=", prompt_sizes[0]))
+            filters.append((GRID_COLUMNS[1], "<=", prompt_sizes[1]))
+        df = pq.read_table(file, filters=filters or None, memory_map=True).to_pandas()
+        if models is not None:
+            # Return the models in the requested order, like the Arrow and NPZ readers
+            rank = {model: index for index, model in enumerate(models)}
+            order = np.argsort(df[GRID_COLUMNS[0]].map(rank).to_numpy(), kind="stable")
+            df = df.iloc[order].reset_index(drop=True)
+        return df
+
+    if format == "arrow":
+        pa = _import_pyarrow()
+        import pyarrow.ipc
+
+        reader = pa.ipc.open_file(pa.memory_map(file, "r"))
+        stored_models = json.loads(reader.schema.metadata[b"models"])
+        batches = []
+        for index in _model_indexes(stored_models, models):
+            batch = reader.get_batch(index)
+            start, stop = _prompt_size_bounds(batch.column(1).to_numpy(), prompt_sizes)
+            batches.append(batch.slice(start, stop - start))
+        return pa.Table.from_batches(batches, schema=reader.schema).to_pandas()
+
+    stored_models = _npz_member(file, "models").tolist()
+    offsets = _npz_member(file, "model_offsets")
+    prompt_column = _npz_member(file, "prompt_sizes")
+    blocks = []
+    for index in _model_indexes(stored_models, models):
+        block_start = offsets[index]
+        start, stop = _prompt_size_bounds(prompt_column[block_start:offsets[index + 1]], prompt_sizes)
+        blocks.append(slice(block_start + start, block_start + stop))
+    columns = [
+        np.concatenate([_npz_member(file, name)[block] for block in blocks])
+        for name in ("model_codes", "prompt_sizes", "messages_per_day", "tokens_per_month", "costs")
+    ]
+    column_names = grid_columns(np.issubdtype(columns[-1].dtype, np.integer))
+    return pd.DataFrame(
+        {
+            column_names[0]: pd.Categorical.from_codes(columns[0], categories=stored_models),
+            **dict(zip(column_names[1:], columns[1:])),
+        },
+        columns=column_names,
+    )
+
+
+def _model_indexes(stored_models, models):
+    if models is None:
+        return range(len(stored_models))
+    unknown = [model for model in models if model not in stored_models]
+    if unknown:
+        raise ValueError(f"Model(s) not in the file: {', '.join(unknown)}")
+    return [stored_models.index(model) for model in models]
+
+
+def _prompt_size_bounds(prompt_column, prompt_sizes):
+    # Within a model block, rows are sorted by prompt size
+    if prompt_sizes is None:
+        return 0, len(prompt_column)
+    return (
+        int(np.searchsorted(prompt_column, prompt_sizes[0], side="left")),
+        int(np.searchsorted(prompt_column, prompt_sizes[1], side="right")),
+    )
+
+
+def calculate_usage_cost(model, prompt_tokens=0, completion_tokens=None, quantity=1, pricing=None):
+    """
+    Calculate the cost of a single API call from its actual usage.
+
+    This applies the per-message semantics of calculate_cost and calculate_cost_ai21:
+    models whose cost scales with the prompt pay the prompt and completion prices,
+    other token models pay the prompt price for every token, and image and minute
+    priced models pay per image or per second of audio.
+
+    Parameters
+    ----------
+    model : str
+        The model used.
+    prompt_tokens : int, optional
+        The number of prompt tokens, default is 0.
+    completion_tokens : int, optional
+        The number of completion tokens, default is the model's completion multiplier
+        times the prompt tokens.
+    quantity : int, optional
+        The number of images, or seconds of audio, of image and minute priced models.
+    pricing : PricingTable, optional
+        The prices to use, default is PRICING.
+
+    Returns
+    -------
+    cost : float
+        The cost of the call.
+
+    Raises
+    ------
+    ValueError
+        If the model is not supported.
+    """
+    price = (pricing or PRICING).get(model)
+    if price is None:
+        raise ValueError(f"Invalid model: {model}")
+    if price.unit != "token":
+        cost = price.prompt_price * quantity
+    elif price.scales_with_prompt:
+        if completion_tokens is None:
+            completion_tokens = prompt_tokens * price.completion_multiplier
+        cost = prompt_tokens * price.prompt_price + completion_tokens * price.completion_price
+    else:
+        cost = (prompt_tokens + (completion_tokens or 0)) * price.prompt_price
+    return cost / price.divisor
+
+
+def read_usage_log(file):
+    """
+    Lazily read the records of a JSONL or CSV request log, optionally gzip compressed.
+
+    Parameters
+    ----------
+    file : str
+        The path of the log; the format is taken from the extension (.jsonl, .json,
+        .csv, optionally followed by .gz).
+
+    Yields
+    ------
+    record : dict
+        One record per API call.
+    """
+    name = file[:-3] if file.endswith(".gz") else file
+    opener = gzip.open if file.endswith(".gz") else open
+    with opener(file, "rt", newline="") as f:
+        if name.endswith(".csv"):
+            yield from csv.DictReader(f)
+        elif name.endswith((".jsonl", ".json")):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            raise ValueError(f"Unsupported log format: {file}")
+
+
+def _int_field(record, field):
+    # CSV logs and some exporters write counts as "12.0": accept any whole number
+    value = record.get(field)
+    if value in (None, ""):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        try:
+            return int(value)
+        except ValueError:
+            pass
+    number = float(value)
+    if not number.is_integer():
+        raise ValueError(f"{field} is not a whole number: {value!r}")
+    return int(number)
+
+
+def _usage_day(record):
+    value = record.get("date") or record.get("timestamp")
+    if value in (None, ""):
+        return "unknown"
+    try:
+        seconds = float(value)
+    except (TypeError, ValueError):
+        return str(value)[:10]
+    while abs(seconds) >= EPOCH_SECONDS_LIMIT:
+        seconds /= 1000
+    try:
+        return datetime.fromtimestamp(seconds, tz=timezone.utc).date().isoformat()
+    except (ValueError, OverflowError, OSError):
+        return "unknown"
+
+
+def price_usage_records(records, pricing=None, counter=None, batch_size=USAGE_BATCH_SIZE):
+    """
+    Price a stream of request log records, tokenizing prompt and completion texts in batches.
+
+    Records give the `model`, a `timestamp` (epoch seconds, milliseconds or ISO 8601)
+    or `date`, and either `prompt_tokens` or the `prompt` text; `completion_tokens` or
+    the `completion` text are optional, as is `quantity` for image and minute priced
+    models. Counts may be written as floats, as long as they are whole numbers.
+
+    Parameters
+    ----------
+    records : iterable of dict
+        The log records, e.g. from read_usage_log.
+    pricing : PricingTable, optional
+        The prices to use, default is PRICING.
+    counter : TokenCounter, optional
+        The token counter for texts, default is TOKEN_COUNTER.
+    batch_size : int, optional
+        The number of records tokenized together.
+
+    Yields
+    ------
+    model, day, prompt_tokens, completion_tokens, cost : tuple
+        The priced usage of each record; records of unknown models, or with counts that
+        are not whole numbers, have a cost of None.
+    """
+    pricing = pricing or PRICING
+    counter = counter or TOKEN_COUNTER
+    records = iter(records)
+    while True:
+        batch = list(itertools.islice(records, batch_size))
+        if not batch:
+            return
+
+        tokens = {}
+        invalid = set()
+        for token_field, text_field in (("prompt_tokens", "prompt"), ("completion_tokens", "completion")):
+            counts = []
+            for index, record in enumerate(batch):
+                try:
+                    counts.append(_int_field(record, token_field))
+                except (TypeError, ValueError):
+                    counts.append(None)
+                    invalid.add(index)
+            texts_by_model = {}
+            for index, record in enumerate(batch):
+                if counts[index] is None and index not in invalid and record.get(text_field) is not None:
+                    texts_by_model.setdefault(record.get("model"), []).append(index)
+            for model, indexes in texts_by_model.items():
+                texts = [batch[index][text_field] for index in indexes]
+                for index, count in zip(indexes, counter.encode_many(texts, model)):
+                    counts[index] = count
+            tokens[token_field] = counts
+        _count("records priced", len(batch))
+
+        for index, (record, prompt_tokens, completion_tokens) in enumerate(
+            zip(batch, tokens["prompt_tokens"], tokens["completion_tokens"])
+        ):
+            model = record.get("model")
+            price = pricing.get(model)
+            prompt_tokens = prompt_tokens or 0
+            try:
+                quantity = _int_field(record, "quantity")
+                if quantity is None:
+                    quantity = 1
+            except (TypeError, ValueError):
+                invalid.add(index)
+            if price is None or index in invalid:
+                cost = None
+            else:
+                if completion_tokens is None and price.unit == "token" and price.scales_with_prompt:
+                    completion_tokens = prompt_tokens * price.completion_multiplier
+                cost = calculate_usage_cost(model, prompt_tokens, completion_tokens, quantity, pricing)
+            yield model, _usage_day(record), prompt_tokens, completion_tokens or 0, cost
+
+
+def aggregate_usage(priced_records):
+    """
+    Aggregate priced usage per model and day.
+
+    Only one accumulator per (model, day) is kept, so memory does not grow with the
+    number of records.
+
+    Parameters
+    ----------
+    priced_records : iterable of tuple
+        The output of price_usage_records.
+
+    Returns
+    -------
+    aggregates : dict
+        Maps (model, day) to [requests, prompt tokens, completion tokens, cost].
+    skipped : int
+        The number of records of unknown models or with invalid counts.
+    """
+    aggregates = {}
+    skipped = 0
+    for model, day, prompt_tokens, completion_tokens, cost in priced_records:
+        if cost is None:
+            skipped += 1
+            continue
+        totals = aggregates.get((model, day))
+        if totals is None:
+            totals = aggregates[(model, day)] = [0, 0, 0, 0.0]
+        totals[0] += 1
+        totals[1] += prompt_tokens
+        totals[2] += completion_tokens
+        totals[3] += cost
+    return aggregates, skipped
+
+
+def peak_rss_bytes():
+    """
+    Get the peak resident set size of the process, or None where it is not available.
+    """
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def calculate_api_billing(
+    paraphrase_requests: int = 0,
+    summarize_requests: int = 0,
+    grammar_correction_requests: int = 0,
+    text_improvement_requests: int = 0,
+    text_segmentation_requests: int = 0,
+    contextual_answers_requests: int = 0,
+    exact: bool = False,
+) -> float:
+    """
+    Calculate the total cost for using Task-Specific APIs.
+
+    Parameters
+    ----------
+    paraphrase_requests : int, optional
+        Number of Paraphrase API requests, default is 0.
+    summarize_requests : int, optional
+        Number of Summarize API requests, default is 0.
+    grammar_correction_requests : int, optional
+        Number of Grammatical Error Corrections API requests, default is 0.
+    text_improvement_requests : int, optional
+        Number of Text Improvements API requests, default is 0.
+    text_segmentation_requests : int, optional
+        Number of Text Segmentation API requests, default is 0.
+    contextual_answers_requests : int, optional
+        Number of Contextual Answers API requests, default is 0.
+    exact : bool, optional
+        Return the cost as an exact int of micro-dollars, rounded half to even.
+
+    Returns
+    -------
+    float
+        Total cost for using the APIs.
+    """
+    if exact:
+        counts = (
+            paraphrase_requests,
+            summarize_requests,
+            grammar_correction_requests,
+            text_improvement_requests,
+            text_segmentation_requests,
+            contextual_answers_requests,
+        )
+        cost = sum(Fraction(count) * to_micros(price) for count, price in zip(counts, TASK_API_COSTS.values()))
+        return _check_int64(_round_half_even(cost.numerator, cost.denominator))
+    return (
+        paraphrase_requests * TASK_API_COSTS["paraphrase"]
+        + summarize_requests * TASK_API_COSTS["summarize"]
+        + grammar_correction_requests * TASK_API_COSTS["grammar_correction"]
+        + text_improvement_requests * TASK_API_COSTS["text_improvement"]
+        + text_segmentation_requests * TASK_API_COSTS["text_segmentation"]
+        + contextual_answers_requests * TASK_API_COSTS["contextual_answers"]
+    )
+
+
+def calculate_api_billing_batch(requests, groups=None, exact=False):
+    """
+    Calculate the Task-Specific API cost of many rows of request counts at once.
+
+    This is the vectorized counterpart of calculate_api_billing: every row is priced
+    with the same floating point operations, in the same order, so the row costs are
+    bit-for-bit identical to the scalar function. Group totals add the row costs in
+    row order, like summing the scalar costs in a loop.
+
+    Parameters
+    ----------
+    requests : pandas.DataFrame or mapping of array_like
+        The request counts per API, in columns named after the keys of TASK_API_COSTS
+        or after the keyword arguments of calculate_api_billing (e.g. "paraphrase" or
+        "paraphrase_requests"). Missing APIs count as 0 and other columns are ignored.
+    groups : str or array_like, optional
+        The group of each row, e.g. the tenant, or the name of the column holding it.
+    exact : bool, optional
+        Price whole request counts in exact int64 micro-dollars, like
+        calculate_api_billing with exact=True, and sum them exactly.
+
+    Returns
+    -------
+    costs : numpy.ndarray
+        The float64, or int64 micro-dollar, cost of each row.
+    totals : pandas.Series or float
+        The total cost of each group, in order of first appearance, or the grand total
+        when no groups are given (an int when exact).
+
+    Raises
+    ------
+    ValueError
+        If no column holds request counts, the columns differ in length, a group is
+        missing (None or NaN), or exact request counts are not whole numbers.
+    OverflowError
+        If an exact cost or group total does not fit in int64.
+    """
+    columns = {}
+    for api in TASK_API_COSTS:
+        for name in (api, f"{api}_requests"):
+            if name in requests:
+                counts = np.asarray(requests[name])
+                columns[api] = counts.astype(np.int64 if exact else np.float64)
+                if exact and not np.issubdtype(counts.dtype, np.integer) and np.any(columns[api] != counts):
+                    raise ValueError(f"Exact billing needs whole request counts in {name}.")
+    if not columns:
+        raise ValueError(f"No request counts given, expected columns among {', '.join(TASK_API_COSTS)}.")
+    if len({len(column) for column in columns.values()}) != 1:
+        raise ValueError("All request count columns must have the same length.")
+    rows = len(next(iter(columns.values())))
+    if exact:
+        return _micro_api_billing_batch(requests, columns, rows, groups)
+
+    costs = np.zeros(rows, dtype=np.float64)
+    for api, cost in TASK_API_COSTS.items():
+        if api in columns:
+            costs = costs + columns[api] * cost
+
+    if groups is None:
+        return costs, float(np.bincount(np.zeros(rows, dtype=np.intp), costs, 1)[0])
+    codes, uniques = _billing_group_codes(requests, groups, rows)
+    # bincount adds the weights of each bin in input order, like a loop over the rows
+    return costs, pd.Series(np.bincount(codes, costs, len(uniques)), index=uniques, name="Cost ($)")
+
+
+def _billing_group_codes(requests, groups, rows):
+    if isinstance(groups, str):
+        groups = requests[groups]
+    if not isinstance(groups, (np.ndarray, pd.Series, pd.Index)):
+        # Keep None and NaN as missing, a string array would turn them into "None" and "nan"
+        groups = np.asarray(groups, dtype=object)
+    codes, uniques = pd.factorize(groups)
+    if len(codes) != rows:
+        raise ValueError("groups must have one entry per row.")
+    # factorize codes missing values as -1, which no group total could hold
+    if (codes < 0).any():
+        raise ValueError(f"groups is missing for row {int(np.argmax(codes < 0))}.")
+    return codes, uniques
+
+
+def _micro_api_billing_batch(requests, columns, rows, groups):
+    costs = np.zeros(rows, dtype=np.int64)
+    for api, price in TASK_API_COSTS.items():
+        if api in columns:
+            costs = _checked_add(costs, _checked_multiply(columns[api], to_micros(price)))
+
+    if groups is None:
+        return costs, _check_int64(sum_micros(costs))
+    codes, uniques = _billing_group_codes(requests, groups, rows)
+    order = np.argsort(codes, kind="stable")
+    starts = np.searchsorted(codes[order], np.arange(len(uniques)))
+    largest = int(np.abs(costs).max()) if rows else 0
+    if largest * rows <= INT64_MAX:
+        # No partial sum can overflow
+        totals = np.add.reduceat(costs[order], starts) if rows else np.zeros(0, dtype=np.int64)
+    else:
+        bounds = np.append(starts, rows)
+        totals = np.array(
+            [_check_int64(sum_micros(costs[order[start:stop]])) for start, stop in zip(bounds[:-1], bounds[1:])],
+            dtype=np.int64,
+        )
+    return costs, pd.Series(totals, index=uniques, name="Cost (micro-$)")
+
+def quote_cost(model, prompt_size, tokens_per_month, pricing=None):
+    """
+    Calculate the cost of an OpenAI or AI21 model, with the math of calculate_cost / calculate_cost_ai21.
+
+    Raises
+    ------
+    ValueError
+        If the model is not supported.
+    TypeError
+        If the prompt size or the number of tokens per month is not an integer.
+    """
+    _check_quote_sizes(prompt_size, tokens_per_month)
+    price = (pricing or PRICING).get(model)
+    if price is None:
+        raise ValueError(f"Invalid model: {model}")
+    return _cost_from_price(price, prompt_size, tokens_per_month)
+
+
+def _check_quote_sizes(prompt_size, tokens_per_month):
+    # The vectorized engine prices int64 sizes: reject what it would silently truncate or coerce
+    for name, value in (("prompt_size", prompt_size), ("tokens_per_month", tokens_per_month)):
+        if not isinstance(value, numbers.Integral) or isinstance(value, bool):
+            raise TypeError(f"{name} must be an integer, got {value!r}")
+
+
+def quote_costs(items, pricing=None):
+    """
+    Price a batch of quotes in one pass of the vectorized engine.
+
+    Parameters
+    ----------
+    items : sequence of dict
+        The quotes, each with a `model`, `prompt_size` and `tokens_per_month`.
+    pricing : PricingTable, optional
+        The prices to use, default is PRICING.
+
+    Returns
+    -------
+    costs : list of float
+        The cost of each quote, identical to quote_cost.
+
+    Raises
+    ------
+    ValueError
+        If a model is not supported.
+    TypeError
+        If a prompt size or number of tokens per month is not an integer.
+    """
+    for item in items:
+        _check_quote_sizes(item["prompt_size"], item["tokens_per_month"])
+    model_ids = {}
+    ids = [model_ids.setdefault(item["model"], len(model_ids)) for item in items]
+    costs = calculate_cost_grid(
+        ids,
+        [item["prompt_size"] for item in items],
+        [item["tokens_per_month"] for item in items],
+        list(model_ids),
+        pricing,
+    )
+    return costs.tolist()
+
+
+def max_affordable(cost, budget, lower=0, upper=None):
+    """
+    Find the largest integer x >= lower with cost(x) <= budget, for a non-decreasing cost function.
+
+    The upper end is found by doubling when it is not given, then the boundary is
+    located by bisection, so this needs O(log x) cost evaluations.
+
+    Parameters
+    ----------
+    cost : callable
+        The non-decreasing cost function of the free parameter.
+    budget : float
+        The budget.
+    lower : int, optional
+        The smallest value of the free parameter, default is 0.
+    upper : int, optional
+        A value known to be over budget.
+
+    Returns
+    -------
+    x : int, math.inf or None
+        The largest affordable value, math.inf if the search reaches MAX_AFFORDABLE
+        without exceeding the budget, or None if even `lower` is over budget.
+    """
+    if cost(lower) > budget:
+        return None
+    if upper is None:
+        upper = max(1, lower * 2)
+        while cost(upper) <= budget:
+            if upper >= MAX_AFFORDABLE:
+                return math.inf
+            upper *= 2
+    while upper - lower > 1:
+        middle = (lower + upper) // 2
+        if cost(middle) <= budget:
+            lower = middle
+        else:
+            upper = middle
+    return lower
+
+
+def _refine_affordable(cost, budget, estimate, lower):
+    # The closed form is computed in floating point: step to the exact integer boundary,
+    # and fall back to bisection when it is not within a few steps
+    if estimate >= MAX_AFFORDABLE:
+        return math.inf
+    x = max(lower, estimate)
+    for _ in range(REFINE_STEPS):
+        if x == lower or cost(x) <= budget:
+            break
+        x -= 1
+    else:
+        return max_affordable(cost, budget, lower, upper=x)
+    for _ in range(REFINE_STEPS):
+        if cost(x + 1) > budget:
+            return x
+        x += 1
+    return max_affordable(cost, budget, lower=x)
+
+
+def solve_budget(model, budget, prompt_size=None, tokens_per_month=None, pricing=None):
+    """
+    Solve for the largest prompt size or monthly volume a budget affords on a model.
+
+    Exactly one of `prompt_size` and `tokens_per_month` must be omitted: it is the
+    free parameter. The cost formulas of calculate_cost / calculate_cost_ai21 are
+    linear in both, so the answer is computed in closed form and then pinned to the
+    exact integer boundary of the floating point cost. Non-linear cost functions can be
+    solved with max_affordable instead.
+
+    Parameters
+    ----------
+    model : str
+        The model to use.
+    budget : float
+        The monthly budget in dollars.
+    prompt_size : int, optional
+        The size of the prompt.
+    tokens_per_month : int, optional
+        The number of tokens to generate per month.
+    pricing : PricingTable, optional
+        The prices to use, default is PRICING.
+
+    Returns
+    -------
+    value : int, math.inf or None
+        The largest affordable value of the free parameter, math.inf if any value is
+        affordable, or None if none is.
+
+    Raises
+    ------
+    ValueError
+        If the model is not supported or the free parameter is ambiguous.
+    """
+    if (prompt_size is None) == (tokens_per_month is None):
+        raise ValueError("Give exactly one of prompt_size and tokens_per_month; the other one is solved for.")
+    pricing = pricing or PRICING
+    price = pricing.get(model)
+    if price is None:
+        raise ValueError(f"Invalid model: {model}")
+    if budget < 0:
+        return None
+
+    if tokens_per_month is None:
+        def cost(x):
+            return _cost_from_price(price, prompt_size, x)
+
+        if price.scales_with_prompt:
+            tokens_per_prompt = prompt_size_to_token_size(prompt_size)
+            rate = tokens_per_prompt * (price.prompt_price + price.completion_multiplier * price.completion_price) / price.divisor
+        else:
+            rate = price.prompt_price / price.divisor
+        lower = 0
+    else:
+        def cost(x):
+            return _cost_from_price(price, x, tokens_per_month)
+
+        if not price.scales_with_prompt:
+            # The prompt size does not change the cost
+            return math.inf if cost(1) <= budget else None
+        # Every prompt size past 1 adds a quarter token
+        rate = tokens_per_month * (price.prompt_price + price.completion_multiplier * price.completion_price) / 4 / price.divisor
+        lower = 1
+
+    if cost(lower) > budget:
+        return None
+    if rate <= 0:
+        return math.inf
+    estimate = int(min(budget / rate + lower, MAX_AFFORDABLE))
+    return _refine_affordable(cost, budget, estimate, lower)
+
+
+def rank_models_by_budget(budget, prompt_size, pricing=None):
+    """
+    Rank the token priced models by the monthly volume a budget affords at a given prompt size.
+
+    Models priced per image or per minute are left out, their volumes are not tokens.
+
+    Returns
+    -------
+    ranking : list of tuple
+        (model, tokens_per_month) pairs, most affordable first.
+    """
+    pricing = pricing or PRICING
+    models = [price.name for price in pricing if price.unit == "token"]
+    volumes = [(model, solve_budget(model, budget, prompt_size=prompt_size, pricing=pricing)) for model in models]
+    return sorted(volumes, key=lambda item: -1 if item[1] is None else item[1], reverse=True)
+
+
+def _sample_constant(rng, size, value):
+    return np.full(size, value, dtype=np.float64)
+
+
+def _sample_negative_binomial(rng, size, mean, dispersion):
+    # Variance is mean + mean**2 / dispersion: the lower the dispersion, the burstier
+    return rng.negative_binomial(dispersion, dispersion / (dispersion + mean), size)
+
+
+def _sample_lognormal(rng, size, median, sigma):
+    return rng.lognormal(math.log(median), sigma, size)
+
+
+def _sample_uniform(rng, size, low, high):
+    return rng.integers(int(low), int(high), size, endpoint=True)
+
+
+# Distributions of simulated traffic, mapping their name to a sampler and its parameter names
+SIMULATION_DISTRIBUTIONS = {
+    "constant": (_sample_constant, ("value",)),
+    "poisson": (lambda rng, size, mean: rng.poisson(mean, size), ("mean",)),
+    "negative_binomial": (_sample_negative_binomial, ("mean", "dispersion")),
+    "lognormal": (_sample_lognormal, ("median", "sigma")),
+    "normal": (lambda rng, size, mean, std: rng.normal(mean, std, size), ("mean", "std")),
+    "uniform": (_sample_uniform, ("low", "high")),
+}
+
+
+def parse_distribution(spec):
     """
+    Parse a distribution spec such as "poisson:25" or "lognormal:500,0.6".
 
-    df = pd.DataFrame(
-        columns=[
-            "Model",
-            "Prompt Size (k words)",
-            "Messages per Day",
-            "Tokens per Month",
-            "Cost per Month ($)",
-        ]
+    Parameters
+    ----------
+    spec : str
+        The name of one of SIMULATION_DISTRIBUTIONS, a colon and its comma separated
+        parameters.
+
+    Returns
+    -------
+    sample : callable
+        Draws `size` non-negative integers from the distribution with a numpy Generator,
+        as sample(rng, size).
+
+    Raises
+    ------
+    ValueError
+        If the distribution is unknown or its parameters are invalid.
+    """
+    name, _, arguments = spec.partition(":")
+    if name not in SIMULATION_DISTRIBUTIONS:
+        raise ValueError(f"Unknown distribution {name!r}, choose one of {', '.join(SIMULATION_DISTRIBUTIONS)}.")
+    sampler, parameters = SIMULATION_DISTRIBUTIONS[name]
+    try:
+        values = [float(value) for value in arguments.split(",")] if arguments else []
+    except ValueError:
+        raise ValueError(f"Invalid parameters in distribution {spec!r}.") from None
+    if len(values) != len(parameters) or any(value < 0 or not math.isfinite(value) for value in values):
+        raise ValueError(f"Distribution {name} takes non-negative {', '.join(parameters)}, got {spec!r}.")
+
+    def sample(rng, size):
+        return np.maximum(np.rint(sampler(rng, size, *values)), 0).astype(np.int64)
+
+    return sample
+
+
+def simulate_traffic(
+    trials=SIMULATION_TRIALS,
+    days=SIMULATION_DAYS,
+    messages_per_day=SIMULATION_MESSAGES_PER_DAY,
+    prompt_tokens=SIMULATION_PROMPT_TOKENS,
+    completion_tokens=None,
+    seed=None,
+):
+    """
+    Simulate months of traffic: per-day message counts and per-message token sizes.
+
+    Each trial is one month of `days` days. Messages are drawn in chunks of at most
+    SIMULATION_CHUNK_MESSAGES and reduced to per-trial token totals right away, so
+    memory does not grow with the number of simulated messages. Message counts, prompt
+    and completion sizes are drawn from independent streams of the seed, so a seed
+    always reproduces the same traffic.
+
+    Parameters
+    ----------
+    trials : int, optional
+        The number of simulated months.
+    days : int, optional
+        The number of days per month.
+    messages_per_day : str, optional
+        The distribution of the number of messages per day, see parse_distribution.
+    prompt_tokens : str, optional
+        The distribution of the number of prompt tokens per message.
+    completion_tokens : str, optional
+        The distribution of the number of completion tokens per message; when omitted,
+        completions are priced with each model's completion multiplier instead.
+    seed : int, optional
+        The seed of the random number generator.
+
+    Returns
+    -------
+    messages, prompt_totals, completion_totals : numpy.ndarray
+        The number of messages and the total prompt and completion tokens of every
+        trial; completion_totals is None without a completion distribution.
+
+    Raises
+    ------
+    ValueError
+        If there are no trials or no days, or a distribution is invalid.
+    """
+    if trials < 1 or days < 1:
+        raise ValueError(f"Simulate at least 1 trial of at least 1 day, got {trials} trials of {days} days.")
+    sample_messages = parse_distribution(messages_per_day)
+    sample_prompts = parse_distribution(prompt_tokens)
+    sample_completions = parse_distribution(completion_tokens) if completion_tokens else None
+    message_rng, prompt_rng, completion_rng = (
+        np.random.default_rng(stream) for stream in np.random.SeedSequence(seed).spawn(3)
     )
-    for model in [
-            "gpt4_8k",
-            "gpt4_32k",
-            "chat_gpt",
-            "ada",
-            "babbage",
-            "curie",
-            "davinci",
-            "embedding_ada",
-            "embedding_curie",
-            "image_1024",
-            "image_512",
-            "image_256",
-            "whisper",
-        ]:
-        for prompt_size, messages_per_day in itertools.product(range(LOWER_BOUND_PROMPT_SIZE, UPPER_BOUND_PROMPT_SIZE + 1), range(1, 26)):
-            tokens_per_month = messages_per_day * TOKENS_PER_MESSAGE
-            cost = calculate_cost(model, prompt_size, tokens_per_month)
-            df = df.append(
-                {
-                    "Model": model,
-                    "Prompt Size (k words)": prompt_size,
-                    "Messages per Day": messages_per_day,
-                    "Tokens per Month": tokens_per_month,
-                    "Cost per Month ($)": cost,
-                },
-                ignore_index=True,
-            )
 
-    for model in ["jumbo", "grande", "large"]:
-        for prompt_size, messages_per_day in itertools.product(range(LOWER_BOUND_PROMPT_SIZE, UPPER_BOUND_PROMPT_SIZE + 1), range(1, 26)):
-            tokens_per_month = messages_per_day * TOKENS_PER_MESSAGE
-            cost = calculate_cost_ai21(model, prompt_size, tokens_per_month)
-            df = df.append(
-                {
-                    "Model": model,
-                    "Prompt Size (k words)": prompt_size,
-                    "Messages per Day": messages_per_day,
-                    "Tokens per Month": tokens_per_month,
-                    "Cost per Month ($)": cost,
-                },
-                ignore_index=True,
-            )
+    with _stage("traffic simulation"):
+        messages = sample_messages(message_rng, (trials, days)).sum(axis=1)
+        prompt_totals = np.zeros(trials, dtype=np.float64)
+        completion_totals = np.zeros(trials, dtype=np.float64) if sample_completions else None
+        cumulative = np.cumsum(messages)
+        start = 0
+        while start < trials:
+            offset = cumulative[start - 1] if start else 0
+            stop = max(int(np.searchsorted(cumulative, offset + SIMULATION_CHUNK_MESSAGES, side="right")), start + 1)
+            counts = messages[start:stop]
+            # Trial of every message of the chunk, to sum the message sizes per trial
+            trial_ids = np.repeat(np.arange(stop - start), counts)
+            size = len(trial_ids)
+            prompt_totals[start:stop] = np.bincount(trial_ids, sample_prompts(prompt_rng, size), stop - start)
+            if sample_completions:
+                completion_totals[start:stop] = np.bincount(
+                    trial_ids, sample_completions(completion_rng, size), stop - start
+                )
+            start = stop
+    _count("messages simulated", int(messages.sum()))
+    return messages, prompt_totals, completion_totals
 
-    console.print("Costs exported to DataFrame.", style="bold green")
-    if file:
-        df.to_csv(file, index=False)
-    return df
 
-def calculate_api_billing(
-    paraphrase_requests: int = 0,
-    summarize_requests: int = 0,
-    grammar_correction_requests: int = 0,
-    text_improvement_requests: int = 0,
-    text_segmentation_requests: int = 0,
-    contextual_answers_requests: int = 0,
-) -> float:
+def simulate_spend(
+    models=None,
+    trials=SIMULATION_TRIALS,
+    days=SIMULATION_DAYS,
+    messages_per_day=SIMULATION_MESSAGES_PER_DAY,
+    prompt_tokens=SIMULATION_PROMPT_TOKENS,
+    completion_tokens=None,
+    seed=None,
+    pricing=None,
+):
     """
-    Calculate the total cost for using Task-Specific APIs.
+    Forecast the monthly spend of token priced models with a Monte Carlo simulation.
+
+    Every model is priced on the same simulated traffic, see simulate_traffic, with the
+    per-message semantics of calculate_usage_cost. Costs are linear in the tokens, so
+    a trial's spend is priced from its token totals.
 
     Parameters
     ----------
-    paraphrase_requests : int, optional
-        Number of Paraphrase API requests, default is 0.
-    summarize_requests : int, optional
-        Number of Summarize API requests, default is 0.
-    grammar_correction_requests : int, optional
-        Number of Grammatical Error Corrections API requests, default is 0.
-    text_improvement_requests : int, optional
-        Number of Text Improvements API requests, default is 0.
-    text_segmentation_requests : int, optional
-        Number of Text Segmentation API requests, default is 0.
-    contextual_answers_requests : int, optional
-        Number of Contextual Answers API requests, default is 0.
+    models : sequence of str, optional
+        The models to price, default is every token priced model.
+    pricing : PricingTable, optional
+        The prices to use, default is PRICING.
+
+    The other parameters are those of simulate_traffic.
 
     Returns
     -------
-    float
-        Total cost for using the APIs.
+    spend : numpy.ndarray
+        The monthly spend of every model (rows) in every trial (columns).
+    messages : numpy.ndarray
+        The number of messages of every trial.
+
+    Raises
+    ------
+    ValueError
+        If a model is not supported or not token priced, there are no trials or no
+        days, or a distribution is invalid.
     """
-    COSTS = {
-        "paraphrase": 0.001,
-        "summarize": 0.005,
-        "grammar_correction": 0.0005,
-        "text_improvement": 0.0005,
-        "text_segmentation": 0.001,
-        "contextual_answers": 0.005,
-    }
+    pricing = pricing or PRICING
+    if models is None:
+        models = [price.name for price in pricing if price.unit == "token"]
+    not_token_priced = [model for model in models if model in pricing and pricing[model].unit != "token"]
+    if not_token_priced:
+        raise ValueError(f"Model(s) not priced per token: {', '.join(not_token_priced)}")
+    params = pricing.params(models)
+    messages, prompt_totals, completion_totals = simulate_traffic(
+        trials, days, messages_per_day, prompt_tokens, completion_tokens, seed
+    )
 
-    return (
-        paraphrase_requests * COSTS["paraphrase"]
-        + summarize_requests * COSTS["summarize"]
-        + grammar_correction_requests * COSTS["grammar_correction"]
-        + text_improvement_requests * COSTS["text_improvement"]
-        + text_segmentation_requests * COSTS["text_segmentation"]
-        + contextual_answers_requests * COSTS["contextual_answers"]
+    price_prompt, price_completion, completion_multiplier, divisor, scales = (column[:, None] for column in params.T)
+    with _stage("spend pricing"):
+        if completion_totals is None:
+            completion_totals = np.where(scales != 0, prompt_totals * completion_multiplier, 0.0)
+        spend = np.where(
+            scales != 0,
+            prompt_totals * price_prompt + completion_totals * price_completion,
+            (prompt_totals + completion_totals) * price_prompt,
+        )
+    return spend / divisor, messages
+
+
+def spend_percentiles(spend, percentiles=SIMULATION_PERCENTILES):
+    """
+    Summarize simulated spend by percentiles.
+
+    Parameters
+    ----------
+    spend : numpy.ndarray
+        The output of simulate_spend, one row per model.
+    percentiles : sequence of float, optional
+        The percentiles to compute, default is P50, P95 and P99.
+
+    Returns
+    -------
+    summary : numpy.ndarray
+        The percentiles of every model (rows).
+    """
+    return np.percentile(spend, percentiles, axis=1).T
+
+
+def conversation_models(pricing=None):
+    """
+    List the models conversations can be simulated on: token priced models that scale
+    with the prompt and have a context window.
+    """
+    return [
+        price.name
+        for price in (pricing or PRICING)
+        if price.unit == "token" and price.scales_with_prompt and price.context_window
+    ]
+
+
+def simulate_conversations(
+    models=None,
+    sessions=CONVERSATION_SESSIONS,
+    turns=CONVERSATION_TURNS,
+    user_tokens=CONVERSATION_USER_TOKENS,
+    completion_tokens=CONVERSATION_COMPLETION_TOKENS,
+    system_tokens=0,
+    seed=None,
+    pricing=None,
+):
+    """
+    Price multi-turn chat sessions whose every turn resends the conversation so far.
+
+    The prompt of a turn is the system prompt, every earlier user message and
+    completion, and the new user message. When the prompt and completion exceed the
+    model's context window, the oldest history is truncated to fit; a completion larger
+    than the window is cut to the window. Turns are priced with the per-message
+    semantics of calculate_usage_cost.
+
+    Sessions are simulated in chunks of about SIMULATION_CHUNK_MESSAGES turns, each as
+    a (sessions x turns) array, and every model is priced on the same sessions. The
+    turn counts, user messages and completions are drawn from independent streams of
+    the seed, so a seed always reproduces the same sessions.
+
+    Parameters
+    ----------
+    models : sequence of str, optional
+        The models to price, default is conversation_models(pricing).
+    sessions : int, optional
+        The number of sessions to simulate.
+    turns : str, optional
+        The distribution of the number of turns per session (at least 1), see
+        parse_distribution.
+    user_tokens : str, optional
+        The distribution of the number of tokens per user message.
+    completion_tokens : str, optional
+        The distribution of the number of tokens per completion.
+    system_tokens : int, optional
+        The number of tokens of the system prompt, sent with every turn.
+    seed : int, optional
+        The seed of the random number generator.
+    pricing : PricingTable, optional
+        The prices to use, default is PRICING.
+
+    Returns
+    -------
+    spend : numpy.ndarray
+        The cost of every session (columns) on every model (rows).
+    turn_counts : numpy.ndarray
+        The number of turns of every session.
+    truncated_turns : numpy.ndarray
+        The number of turns whose history was truncated, per model.
+
+    Raises
+    ------
+    ValueError
+        If a model is not supported, not token priced or has no context window, there
+        are no sessions, or a distribution is invalid.
+    """
+    if sessions < 1:
+        raise ValueError(f"Simulate at least 1 session, got {sessions}.")
+    pricing = pricing or PRICING
+    models = conversation_models(pricing) if models is None else list(models)
+    params = pricing.params(models)
+    unsupported = [model for model in models if pricing[model].unit != "token" or not pricing[model].context_window]
+    if unsupported:
+        raise ValueError(f"Model(s) without a token context window: {', '.join(unsupported)}")
+    windows = np.array([pricing[model].context_window for model in models], dtype=np.int64)
+
+    sample_turns = parse_distribution(turns)
+    sample_user = parse_distribution(user_tokens)
+    sample_completions = parse_distribution(completion_tokens)
+    turn_rng, user_rng, completion_rng = (
+        np.random.default_rng(stream) for stream in np.random.SeedSequence(seed).spawn(3)
     )
 
+    turn_counts = np.maximum(sample_turns(turn_rng, sessions), 1)
+    spend = np.zeros((len(models), sessions), dtype=np.float64)
+    truncated_turns = np.zeros(len(models), dtype=np.int64)
+    sessions_per_chunk = max(1, SIMULATION_CHUNK_MESSAGES // max(int(turn_counts.max(initial=1)), 1))
+    with _stage("conversation simulation"):
+        for start in range(0, sessions, sessions_per_chunk):
+            stop = min(start + sessions_per_chunk, sessions)
+            counts = turn_counts[start:stop]
+            active = np.arange(counts.max()) < counts[:, None]
+            # Only real turns are drawn, in session order, so chunking does not change the draws
+            user = np.zeros(active.shape, dtype=np.int64)
+            user[active] = sample_user(user_rng, int(counts.sum()))
+            completions = np.zeros(active.shape, dtype=np.int64)
+            completions[active] = sample_completions(completion_rng, int(counts.sum()))
+
+            exchanged = user + completions
+            # Everything sent and received before each turn
+            history = np.cumsum(exchanged, axis=1) - exchanged
+            full_prompts = system_tokens + history + user
+
+            for index, (price_prompt, price_completion, _, divisor, scales) in enumerate(params):
+                window = windows[index]
+                completion = np.minimum(completions, window)
+                limit = window - completion
+                prompts = np.where(active, np.minimum(full_prompts, limit), 0)
+                truncated_turns[index] += np.count_nonzero(active & (full_prompts > limit))
+                # Costs are linear in the tokens: price each session's exact token totals
+                prompt_totals = prompts.sum(axis=1)
+                completion_totals = completion.sum(axis=1)
+                if scales:
+                    costs = prompt_totals * price_prompt + completion_totals * price_completion
+                else:
+                    costs = (prompt_totals + completion_totals) * price_prompt
+                spend[index, start:stop] = costs / divisor
+    _count("turns simulated", int(turn_counts.sum()))
+    return spend, turn_counts, truncated_turns
+
+
+class CostCache:
+    """
+    Memoization layer in front of calculate_cost and calculate_cost_ai21.
+
+    Quotes are kept in an in-process LRU and, optionally, in a memory-mapped SQLite
+    store shared across runs. Stored quotes are keyed by the fingerprint of the pricing
+    table, so they are invalidated automatically when a price or the cost formulas change.
+
+    Parameters
+    ----------
+    file : str, optional
+        The SQLite file of the on-disk store; only the in-process LRU is used when omitted.
+    pricing : PricingTable, optional
+        The prices to use, default is PRICING.
+    maxsize : int, optional
+        The maximum number of quotes of the in-process LRU, default is COST_CACHE_SIZE.
+    """
+
+    def __init__(self, file=None, pricing=None, maxsize=COST_CACHE_SIZE):
+        self.pricing = pricing or PRICING
+        self.maxsize = maxsize
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._pending = []
+        self._db = None
+        if file:
+            import sqlite3
+
+            self._db = sqlite3.connect(file)
+            self._db.execute(f"PRAGMA mmap_size = {COST_CACHE_MMAP_SIZE}")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS quotes ("
+                "fingerprint TEXT, model TEXT, prompt_size INTEGER, tokens_per_month INTEGER, cost REAL, "
+                "PRIMARY KEY (fingerprint, model, prompt_size, tokens_per_month)) WITHOUT ROWID"
+            )
+            self._db.execute("DELETE FROM quotes WHERE fingerprint != ?", (self.pricing.fingerprint,))
+            self._db.commit()
+
+    def quote(self, model, prompt_size, tokens_per_month):
+        """
+        Get the cost of a model from the cache, computing it with quote_cost on a miss.
+        """
+        key = (model, prompt_size, tokens_per_month)
+        cost = self._memory.get(key)
+        if cost is not None:
+            self.hits += 1
+            _count("cost cache hits")
+            self._memory.move_to_end(key)
+            return cost
+
+        if self._db is not None:
+            row = self._db.execute(
+                "SELECT cost FROM quotes WHERE fingerprint = ? AND model = ? AND prompt_size = ? AND tokens_per_month = ?",
+                (self.pricing.fingerprint, *key),
+            ).fetchone()
+            if row is not None:
+                self.disk_hits += 1
+                _count("cost cache disk hits")
+                self._remember(key, row[0])
+                return row[0]
+
+        self.misses += 1
+        _count("cost cache misses")
+        cost = quote_cost(model, prompt_size, tokens_per_month, self.pricing)
+        self._remember(key, cost)
+        if self._db is not None:
+            self._pending.append((self.pricing.fingerprint, *key, cost))
+            if len(self._pending) >= COST_CACHE_FLUSH_SIZE:
+                self.flush()
+        return cost
+
+    def _remember(self, key, cost):
+        self._memory[key] = cost
+        if len(self._memory) > self.maxsize:
+            self._memory.popitem(last=False)
+
+    def calculate_cost(self, model, prompt_size, tokens_per_month):
+        """
+        Cached calculate_cost.
+        """
+        if self.pricing.get(model, vendor="openai") is None:
+            return calculate_cost(model, prompt_size, tokens_per_month, self.pricing)
+        return self.quote(model, prompt_size, tokens_per_month)
+
+    def calculate_cost_ai21(self, model, prompt_size, tokens_per_month):
+        """
+        Cached calculate_cost_ai21.
+        """
+        if self.pricing.get(model, vendor="ai21") is None:
+            return calculate_cost_ai21(model, prompt_size, tokens_per_month, self.pricing)
+        return self.quote(model, prompt_size, tokens_per_month)
+
+    def flush(self):
+        """
+        Write the newly computed quotes to the on-disk store.
+        """
+        if self._db is not None and self._pending:
+            self._db.executemany("INSERT OR REPLACE INTO quotes VALUES (?, ?, ?, ?, ?)", self._pending)
+            self._db.commit()
+            self._pending.clear()
+
+    def close(self):
+        self.flush()
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def cache_info(self):
+        """
+        Get the cache statistics: hits, disk hits, misses and the size of the in-process LRU.
+        """
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "size": len(self._memory),
+            "maxsize": self.maxsize,
+        }
+
+
+class PricingServer:
+    """
+    Asyncio HTTP/1.1 server answering cost quotes from warm pricing tables and tokenizers.
+
+    Endpoints (JSON bodies):
+
+    - POST /quote: {"model", "prompt_size", "tokens_per_month"} -> {"cost"}
+    - POST /batch: {"items": [quote, ...]} -> {"costs": [...]}
+    - POST /billing: calculate_api_billing keyword arguments -> {"cost"}
+    - POST /tokens: {"texts": [...], "model"} -> {"tokens": [...]}
+    - GET /health -> {"status": "ok", "pricing_version"}
+
+    Parameters
+    ----------
+    pricing : PricingTable, optional
+        The prices to use, default is PRICING.
+    counter : TokenCounter, optional
+        The token counter of /tokens, default is TOKEN_COUNTER.
+    """
+
+    def __init__(self, pricing=None, counter=None):
+        self.pricing = pricing or PRICING
+        self.counter = counter or TOKEN_COUNTER
+        self.requests = 0
+
+    def warm_up(self):
+        """
+        Import numpy, compile the pricing table and load the tokenizers before the first request.
+        """
+        self.pricing.params(grid_models(self.pricing))
+        quote_costs([{"model": model, "prompt_size": 1, "tokens_per_month": 1} for model in self.pricing.models()], self.pricing)
+        encodings = {MODEL_ENCODINGS.get(model, DEFAULT_ENCODING): model for model in self.pricing.models()}
+        for name, model in encodings.items():
+            try:
+                self.counter.encoding(model)
+            except Exception as error:  # e.g. offline without vendored encodings
+                console.print(f"Tokenizer {name} unavailable ({type(error).__name__}).", style="bold red")
+
+    def route(self, method, path, body):
+        """
+        Answer one request.
+
+        Returns
+        -------
+        status, payload : tuple
+            The HTTP status code and the JSON-serializable response.
+        """
+        self.requests += 1
+        try:
+            if method == "GET" and path == "/health":
+                return 200, {"status": "ok", "pricing_version": self.pricing.version}
+            if method != "POST":
+                return 404, {"error": f"Unknown endpoint {method} {path}"}
+            request = json.loads(body or b"{}")
+            if path == "/quote":
+                cost = quote_cost(request["model"], request["prompt_size"], request["tokens_per_month"], self.pricing)
+                return 200, {"model": request["model"], "cost": cost}
+            if path == "/batch":
+                return 200, {"costs": quote_costs(request["items"], self.pricing)}
+            if path == "/billing":
+                return 200, {"cost": calculate_api_billing(**request)}
+            if path == "/tokens":
+                return 200, {"tokens": self.counter.encode_many(request["texts"], request.get("model", "gpt-4"))}
+            return 404, {"error": f"Unknown endpoint {method} {path}"}
+        except (KeyError, TypeError, ValueError) as error:
+            return 400, {"error": f"{type(error).__name__}: {error}"}
+        except Exception as error:
+            return 500, {"error": f"{type(error).__name__}: {error}"}
+
+    async def handle(self, reader, writer):
+        """
+        Serve the requests of one keep-alive connection.
+        """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                status, payload = self.route(method, path.split("?", 1)[0], body)
+                response = json.dumps(payload).encode()
+                keep_alive = headers.get("connection", "").lower() != "close"
+                writer.write(
+                    f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"Content-Length: {len(response)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode()
+                    + response
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host="127.0.0.1", port=SERVER_PORT):
+        """
+        Start listening, and return the asyncio server.
+        """
+        return await asyncio.start_server(self.handle, host, port)
+
+
 @app.command()
 def calculate_costs(
     lower_bound_prompt_size: int = LOWER_BOUND_PROMPT_SIZE,
     upper_bound_prompt_size: int = UPPER_BOUND_PROMPT_SIZE,
     messages_per_day: int = MESSAGES_PER_DAY,
-    monthly_messages: int = MONTHLY_MESSAGES
+    monthly_messages: int = MONTHLY_MESSAGES,
+    pricing_file: str = None,
+    workers: int = 1,
+    export: str = None,
+    format: str = "csv",
+    compression: str = None,
+    cache: str = None,
+    incremental: bool = False,
+    exact: bool = False,
+    profile: bool = False,
+    profile_json: str = None,
 ):
     """
     Calculate the cost of using OpenAI and AI21 models for a given prompt size and number of messages per day.
@@ -366,42 +3422,475 @@ def calculate_costs(
         The upper bound of the prompt size in k words.
         messages_per_day : int
         The number of messages to generate per day.
+        pricing_file : str, optional
+        A JSON or TOML price sheet to use instead of the bundled pricing.json.
+        workers : int
+        The number of processes pricing the exported grid.
+        export : str, optional
+        The file to export the cost grid to; nothing is exported when omitted.
+        format : str
+        The format of the export, one of EXPORT_FORMATS.
+        compression : str, optional
+        The compression codec of columnar export formats.
+        cache : str, optional
+        A SQLite file persisting the quotes across runs.
+        incremental : bool
+        Export to a directory of per-model CSV partitions, only recomputing the
+        partitions and prompt sizes whose inputs changed since the last export.
+        exact : bool
+        Calculate and export exact int64 micro-dollar costs instead of floats.
+        profile : bool
+        Print per-stage timers and counters at the end.
+        profile_json : str, optional
+        Write the per-stage timers and counters to this JSON file.
+
+    Returns
+    -------
+        None
+    """
+    with _profiled_command(profile, profile_json):
+        if export and format not in EXPORT_FORMATS:
+            raise typer.BadParameter(f"Unsupported export format {format!r}, choose one of {', '.join(EXPORT_FORMATS)}.")
+        pricing = load_pricing(pricing_file) if pricing_file else PRICING
+        console.print("Calculating costs for different models...", style="bold magenta")
+
+        cost_cache = CostCache(cache, pricing)
+        # The cache holds float costs; exact costs are cheap enough to recompute
+        cost = functools.partial(calculate_cost, pricing=pricing, exact=True) if exact else cost_cache.calculate_cost
+        for model in pricing.models("openai"):
+            cost_lower_bound = cost(
+                model, lower_bound_prompt_size, monthly_messages
+            )
+            cost_upper_bound = cost(
+                model, upper_bound_prompt_size, monthly_messages
+            )
+
+            if cost_lower_bound is not None and cost_upper_bound is not None:
+                console.print(f"Model: {model}", style="bold")
+                if exact:
+                    console.print(f"Lower bound cost: ${micros_to_decimal(cost_lower_bound)}")
+                    console.print(f"Upper bound cost: ${micros_to_decimal(cost_upper_bound)}")
+                else:
+                    console.print(f"Lower bound cost: ${cost_lower_bound:.2f}")
+                    console.print(f"Upper bound cost: ${cost_upper_bound:.2f}")
+                console.print("\n")
+        cost_cache.close()
+        info = cost_cache.cache_info()
+        console.print(f"Cache: {info['hits']} hits, {info['disk_hits']} disk hits, {info['misses']} misses")
+
+        if export and incremental:
+            if format != "csv":
+                raise typer.BadParameter("Incremental exports are written as CSV partitions.")
+            actions = export_cost_partitions(
+                export,
+                pricing=pricing,
+                lower_bound_prompt_size=lower_bound_prompt_size,
+                upper_bound_prompt_size=upper_bound_prompt_size,
+                exact=exact,
+            )
+            for action in ["written", "updated", "appended", "unchanged", "removed"]:
+                models = [model for model, model_action in actions.items() if model_action == action]
+                if models:
+                    console.print(f"Partitions {action}: {', '.join(models)}")
+        elif export and format == "csv":
+            export_cost_to_csv(
+                file=export,
+                pricing=pricing,
+                lower_bound_prompt_size=lower_bound_prompt_size,
+                upper_bound_prompt_size=upper_bound_prompt_size,
+                workers=workers,
+                exact=exact,
+            )
+        elif export:
+            export_cost_to_columnar(
+                export,
+                format,
+                pricing=pricing,
+                lower_bound_prompt_size=lower_bound_prompt_size,
+                upper_bound_prompt_size=upper_bound_prompt_size,
+                compression=compression,
+                exact=exact,
+            )
+
+
+@app.command()
+def price_log(
+    log_file: str,
+    output: str = None,
+    batch_size: int = USAGE_BATCH_SIZE,
+    pricing_file: str = None,
+    profile: bool = False,
+    profile_json: str = None,
+):
+    """
+    Price a JSONL or CSV request log and aggregate the cost per model and day.
+
+    Parameters
+    ----------
+    log_file : str
+        The request log, one API call per JSON line or CSV row.
+        output : str, optional
+        The CSV file to write the per-model/per-day aggregates to; when omitted, the
+        per-model totals are printed.
+        batch_size : int
+        The number of records tokenized together.
+        pricing_file : str, optional
+        A JSON or TOML price sheet to use instead of the bundled pricing.json.
+        profile : bool
+        Print per-stage timers and counters at the end.
+        profile_json : str, optional
+        Write the per-stage timers and counters to this JSON file.
+
+    Returns
+    -------
+        None
+    """
+    with _profiled_command(profile, profile_json):
+        pricing = load_pricing(pricing_file) if pricing_file else PRICING
+        console.print(f"Pricing request log {log_file}...", style="bold magenta")
+
+        start = time.perf_counter()
+        rows = 0
+
+        def counted(records):
+            nonlocal rows
+            for rows, record in enumerate(records, 1):
+                yield record
+
+        priced = price_usage_records(counted(read_usage_log(log_file)), pricing, batch_size=batch_size)
+        aggregates, skipped = aggregate_usage(priced)
+        elapsed = time.perf_counter() - start
+
+        if output:
+            with open(output, "w", newline="") as csv_file:
+                csv_writer = csv.writer(csv_file)
+                csv_writer.writerow(USAGE_COLUMNS)
+                csv_writer.writerows(
+                    [model, day, *totals] for (model, day), totals in sorted(aggregates.items())
+                )
+            console.print(f"Aggregates exported to {output}.", style="bold green")
+        else:
+            totals_per_model = {}
+            for (model, _), totals in aggregates.items():
+                model_totals = totals_per_model.setdefault(model, [0, 0.0])
+                model_totals[0] += totals[0]
+                model_totals[1] += totals[3]
+            for model, (requests, cost) in totals_per_model.items():
+                console.print(f"Model: {model}", style="bold")
+                console.print(f"Requests: {requests}")
+                console.print(f"Cost: ${cost:.2f}")
+                console.print("\n")
+
+        if skipped:
+            console.print(f"Skipped {skipped} records of unknown models or with invalid counts.", style="bold red")
+        console.print(f"Rows: {rows} ({rows / elapsed if elapsed else 0:,.0f} rows/sec)")
+        peak = peak_rss_bytes()
+        if peak is not None:
+            console.print(f"Peak RSS: {peak / 1e6:.1f} MB")
+
+
+@app.command()
+def serve(host: str = "127.0.0.1", port: int = SERVER_PORT, pricing_file: str = None):
+    """
+    Run the pricing server: an asyncio HTTP API answering quotes from warm pricing tables.
+
+    Parameters
+    ----------
+    host : str
+        The address to listen on.
+        port : int
+        The port to listen on.
+        pricing_file : str, optional
+        A JSON or TOML price sheet to use instead of the bundled pricing.json.
+
+    Returns
+    -------
+        None
+    """
+    pricing = load_pricing(pricing_file) if pricing_file else PRICING
+    pricing_server = PricingServer(pricing)
+    pricing_server.warm_up()
+
+    async def run():
+        server = await pricing_server.start(host, port)
+        console.print(f"Serving quotes on http://{host}:{port} (pricing {pricing.version})", style="bold green")
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        console.print(f"Served {pricing_server.requests} requests.", style="bold magenta")
+
+
+@app.command()
+def budget(
+    budget: float,
+    model: str = None,
+    prompt_size: int = None,
+    tokens_per_month: int = None,
+    pricing_file: str = None,
+):
+    """
+    Solve for the largest prompt size or monthly volume a monthly budget affords.
+
+    Parameters
+    ----------
+    budget : float
+        The monthly budget in dollars.
+        model : str, optional
+        The model to solve for; all models are ranked by affordable volume when omitted.
+        prompt_size : int, optional
+        The size of the prompt; solved for when omitted.
+        tokens_per_month : int, optional
+        The number of tokens to generate per month; solved for when omitted.
+        pricing_file : str, optional
+        A JSON or TOML price sheet to use instead of the bundled pricing.json.
+
+    Returns
+    -------
+        None
+    """
+    pricing = load_pricing(pricing_file) if pricing_file else PRICING
+    if model is None:
+        if prompt_size is None:
+            raise typer.BadParameter("Ranking models needs a --prompt-size.")
+        console.print(f"Tokens per month affordable with ${budget:,.2f} at prompt size {prompt_size}:", style="bold magenta")
+        for model, volume in rank_models_by_budget(budget, prompt_size, pricing):
+            console.print(f"{model}: {_format_affordable(volume)}")
+        return
+
+    try:
+        value = solve_budget(model, budget, prompt_size, tokens_per_month, pricing)
+    except ValueError as error:
+        raise typer.BadParameter(str(error))
+    free_parameter = "Prompt size" if prompt_size is None else "Tokens per month"
+    console.print(f"Model: {model}", style="bold")
+    console.print(f"{free_parameter} affordable with ${budget:,.2f}: {_format_affordable(value)}")
+
+
+def _format_affordable(value):
+    if value is None:
+        return "none"
+    return "unlimited" if value == math.inf else f"{value:,}"
+
+
+@app.command()
+def simulate(
+    trials: int = SIMULATION_TRIALS,
+    days: int = SIMULATION_DAYS,
+    messages_per_day: str = SIMULATION_MESSAGES_PER_DAY,
+    prompt_tokens: str = SIMULATION_PROMPT_TOKENS,
+    completion_tokens: str = None,
+    model: str = None,
+    seed: int = None,
+    pricing_file: str = None,
+    profile: bool = False,
+    profile_json: str = None,
+):
+    """
+    Forecast monthly spend per model from simulated, bursty traffic and report P50/P95/P99.
+
+    Parameters
+    ----------
+    trials : int
+        The number of simulated months.
+        days : int
+        The number of days per month.
+        messages_per_day : str
+        The distribution of messages per day, e.g. "poisson:25" or "negative_binomial:25,5".
+        prompt_tokens : str
+        The distribution of prompt tokens per message, e.g. "lognormal:500,0.6".
+        completion_tokens : str, optional
+        The distribution of completion tokens per message; each model's completion
+        multiplier is used when omitted.
+        model : str, optional
+        The model to simulate; every token priced model when omitted.
+        seed : int, optional
+        The seed of the random number generator, to reproduce a forecast.
+        pricing_file : str, optional
+        A JSON or TOML price sheet to use instead of the bundled pricing.json.
+        profile : bool
+        Print per-stage timers and counters at the end.
+        profile_json : str, optional
+        Write the per-stage timers and counters to this JSON file.
 
     Returns
     -------
         None
     """
-    console.print("Calculating costs for different models...", style="bold magenta")
-
-    for model in [
-        "gpt4_8k",
-        "gpt4_32k",
-        "chat_gpt",
-        "ada",
-        "babbage",
-        "curie",
-        "davinci",
-        "embedding_ada",
-        "embedding_curie",
-        "image_1024",
-        "image_512",
-        "image_256",
-        "whisper",
-    ]:
-        cost_lower_bound = calculate_cost(
-            model, lower_bound_prompt_size, monthly_messages
+    with _profiled_command(profile, profile_json):
+        pricing = load_pricing(pricing_file) if pricing_file else PRICING
+        models = [model] if model else None
+        start = time.perf_counter()
+        try:
+            spend, messages = simulate_spend(
+                models, trials, days, messages_per_day, prompt_tokens, completion_tokens, seed, pricing
+            )
+        except ValueError as error:
+            raise typer.BadParameter(str(error))
+        elapsed = time.perf_counter() - start
+        models = models or [price.name for price in pricing if price.unit == "token"]
+
+        console.print(
+            f"Simulated {trials} months of {days} days: {int(messages.sum()):,} messages "
+            f"({messages.sum() / elapsed if elapsed else 0:,.0f} messages/sec)",
+            style="bold magenta",
         )
-        cost_upper_bound = calculate_cost(
-            model, upper_bound_prompt_size, monthly_messages
+        console.print(f"Messages per month: P50 {np.percentile(messages, 50):,.0f}, P99 {np.percentile(messages, 99):,.0f}")
+        for model, percentiles in zip(models, spend_percentiles(spend)):
+            console.print(f"Model: {model}", style="bold")
+            console.print(
+                ", ".join(f"P{percentile}: ${value:,.2f}" for percentile, value in zip(SIMULATION_PERCENTILES, percentiles))
+            )
+
+
+@app.command()
+def compare(
+    pricing_files: List[str],
+    lower_bound_prompt_size: int = LOWER_BOUND_PROMPT_SIZE,
+    upper_bound_prompt_size: int = UPPER_BOUND_PROMPT_SIZE,
+    export: str = None,
+    cheapest_export: str = None,
+    profile: bool = False,
+    profile_json: str = None,
+):
+    """
+    Compare price sheets on the same workload grid: cost changes and cheapest model per cell.
+
+    Parameters
+    ----------
+    pricing_files : list of str
+        The JSON or TOML price sheets to compare; the first one is the baseline.
+        lower_bound_prompt_size : int
+        The lower bound of the prompt size in k words.
+        upper_bound_prompt_size : int
+        The upper bound of the prompt size in k words.
+        export : str, optional
+        A CSV file to write the costs of every scenario and their diffs to.
+        cheapest_export : str, optional
+        A CSV file to write the cheapest model of every cell and scenario to.
+        profile : bool
+        Print per-stage timers and counters at the end.
+        profile_json : str, optional
+        Write the per-stage timers and counters to this JSON file.
+
+    Returns
+    -------
+        None
+    """
+    with _profiled_command(profile, profile_json):
+        names = [os.path.splitext(os.path.basename(file))[0] for file in pricing_files]
+        if len(set(names)) < len(names):
+            names = list(pricing_files)
+        comparison = compare_scenarios(
+            dict(zip(names, pricing_files)),
+            prompt_sizes=range(lower_bound_prompt_size, upper_bound_prompt_size + 1),
         )
+        baseline = comparison.costs[0]
+        console.print(f"Baseline: {names[0]}", style="bold magenta")
+        for name in names[1:]:
+            console.print(f"Scenario: {name}", style="bold")
+            diff = comparison.diff(name)
+            unchanged = 0
+            for index, model in enumerate(comparison.models):
+                if np.isnan(diff[index]).all():
+                    console.print(f"{model}: not priced in both sheets")
+                elif not diff[index].any():
+                    unchanged += 1
+                else:
+                    change = np.nanmean(diff[index])
+                    console.print(f"{model}: {change:+,.2f} $/month on average ({change / np.nanmean(baseline[index]):+.1%})")
+            console.print(f"Unchanged models: {unchanged}")
+
+        console.print("Cheapest model (share of cells):", style="bold")
+        for name, cheapest in zip(names, comparison.cheapest()):
+            codes, counts = np.unique(cheapest, return_counts=True)
+            shares = ", ".join(
+                f"{comparison.models[code]} {count / cheapest.size:.0%}"
+                for code, count in sorted(zip(codes, counts), key=lambda item: -item[1])
+            )
+            console.print(f"{name}: {shares}")
+
+        if export:
+            comparison.to_frame().to_csv(export, index=False)
+            console.print(f"Comparison exported to {export}.", style="bold green")
+        if cheapest_export:
+            comparison.cheapest_frame().to_csv(cheapest_export, index=False)
+            console.print(f"Cheapest models exported to {cheapest_export}.", style="bold green")
 
-        if cost_lower_bound is not None and cost_upper_bound is not None:
+
+@app.command()
+def simulate_chat(
+    sessions: int = CONVERSATION_SESSIONS,
+    turns: str = CONVERSATION_TURNS,
+    user_tokens: str = CONVERSATION_USER_TOKENS,
+    completion_tokens: str = CONVERSATION_COMPLETION_TOKENS,
+    system_tokens: int = 0,
+    model: str = None,
+    seed: int = None,
+    pricing_file: str = None,
+    profile: bool = False,
+    profile_json: str = None,
+):
+    """
+    Forecast chat spend from simulated multi-turn sessions that resend their growing history.
+
+    Parameters
+    ----------
+    sessions : int
+        The number of sessions to simulate.
+        turns : str
+        The distribution of turns per session, e.g. "poisson:8".
+        user_tokens : str
+        The distribution of tokens per user message, e.g. "lognormal:60,0.8".
+        completion_tokens : str
+        The distribution of tokens per completion, e.g. "lognormal:250,0.6".
+        system_tokens : int
+        The number of tokens of the system prompt sent with every turn.
+        model : str, optional
+        The model to simulate; every chat capable model when omitted.
+        seed : int, optional
+        The seed of the random number generator, to reproduce a forecast.
+        pricing_file : str, optional
+        A JSON or TOML price sheet to use instead of the bundled pricing.json.
+        profile : bool
+        Print per-stage timers and counters at the end.
+        profile_json : str, optional
+        Write the per-stage timers and counters to this JSON file.
+
+    Returns
+    -------
+        None
+    """
+    with _profiled_command(profile, profile_json):
+        pricing = load_pricing(pricing_file) if pricing_file else PRICING
+        models = [model] if model else conversation_models(pricing)
+        start = time.perf_counter()
+        try:
+            spend, turn_counts, truncated_turns = simulate_conversations(
+                models, sessions, turns, user_tokens, completion_tokens, system_tokens, seed, pricing
+            )
+        except ValueError as error:
+            raise typer.BadParameter(str(error))
+        elapsed = time.perf_counter() - start
+
+        total_turns = int(turn_counts.sum())
+        console.print(
+            f"Simulated {sessions:,} sessions: {total_turns:,} turns "
+            f"({total_turns / elapsed if elapsed else 0:,.0f} turns/sec)",
+            style="bold magenta",
+        )
+        for model, session_spend, percentiles, truncated in zip(
+            models, spend, spend_percentiles(spend), truncated_turns
+        ):
             console.print(f"Model: {model}", style="bold")
-            console.print(f"Lower bound cost: ${cost_lower_bound:.2f}")
-            console.print(f"Upper bound cost: ${cost_upper_bound:.2f}")
-            console.print("\n")
+            console.print(
+                "Per session: "
+                + ", ".join(f"P{percentile}: ${value:,.4f}" for percentile, value in zip(SIMULATION_PERCENTILES, percentiles))
+            )
+            console.print(f"Total: ${session_spend.sum():,.2f}, truncated turns: {truncated / total_turns:.1%}")
 
-        export_cost_to_csv(file="costs.csv")
 
 if __name__ == "__main__":
     app()
@@ -1,9 +1,18 @@
+import asyncio
+import base64
+import hashlib
 import itertools
+import json
+import math
 from tempfile import TemporaryDirectory
 from unittest.mock import patch
 import pytest
+from hypothesis import given, settings, strategies as st
 from calculator import *
+import calculator as calculator_module
 import os
+import subprocess
+import sys
 
 # Tests for word_to_token_size function
 def test_word_to_token_size():
@@ -16,14 +25,80 @@ def test_word_to_token_size():
     word = "chatbot"
     token_count = word_to_token_size(word)
 
-    # GPT-4 tokenizes "chatbot" as a single token
-    assert token_count == 1
+    # GPT-4 tokenizes "chatbot" as "chat" + "bot"
+    assert token_count == 2
 
     word = "conversational"
     token_count = word_to_token_size(word)
 
-    # GPT-4 tokenizes "conversational" as two tokens
-    assert token_count == 2
+    # GPT-4 tokenizes "conversational" as "con" + "vers" + "ational"
+    assert token_count == 3
+
+
+def test_vendored_encodings_offline():
+    # The bundled encoding files are tiktoken's, byte for byte
+    expected_hashes = {
+        "cl100k_base": "223921b76ee99bde995b7ff738513eef100fb51d18c93597a113bcffe865b2a7",
+        "r50k_base": "306cd27f03c1a714eca7108e03d66b7dc042abe8c258b44c199a7ed9838dd930",
+    }
+    for name, expected_hash in expected_hashes.items():
+        with open(os.path.join(ENCODINGS_DIR, f"{name}.tiktoken"), "rb") as f:
+            assert hashlib.sha256(f.read()).hexdigest() == expected_hash
+
+    # The bundled encoding files are used, never tiktoken's download
+    with patch("tiktoken.get_encoding", side_effect=AssertionError("encoding downloaded")):
+        counter = TokenCounter()
+        assert counter.count_tokens("hello", model="gpt4_8k") == 1
+        assert counter.count_tokens("hello", model="davinci") == 1
+        assert counter.encoding("davinci").n_vocab == 50257
+        assert counter.encoding("gpt4_8k").n_vocab == 100277
+
+@given(st.integers(min_value=-10, max_value=200_000))
+def test_prompt_size_to_token_size(size_in_tokens):
+    # The closed form must match the string-building helpers exactly, off-by-one included
+    expected = estimate_token_size(generate_prompt_from_size_in_tokens(size_in_tokens))
+    assert prompt_size_to_token_size(size_in_tokens) == expected
+
+
+@given(
+    st.sampled_from(["gpt4_8k", "gpt4_32k", "chat_gpt", "jumbo", "grande", "large"]),
+    st.integers(min_value=0, max_value=100_000),
+    st.integers(min_value=0, max_value=10_000_000),
+)
+def test_calculate_cost_closed_form(model, prompt_size, tokens_per_month):
+    price = PRICING[model]
+    tokens_per_prompt = estimate_token_size(generate_prompt_from_size_in_tokens(prompt_size))
+    expected = (
+        tokens_per_month * tokens_per_prompt * price.prompt_price
+        + tokens_per_month * tokens_per_prompt * price.completion_multiplier * price.completion_price
+    ) / 1000
+    scalar = calculate_cost_ai21 if model in AI21_MODELS else calculate_cost
+    assert scalar(model, prompt_size, tokens_per_month) == expected
+
+
+def write_toy_encoding(directory):
+    # Byte-level vocabulary plus two merges, saved in tiktoken's format as cl100k_base
+    ranks = [bytes([i]) for i in range(256)] + [b"he", b"ll"]
+    with open(os.path.join(directory, "cl100k_base.tiktoken"), "w") as f:
+        for rank, token in enumerate(ranks):
+            f.write(f"{base64.b64encode(token).decode()} {rank}\n")
+
+
+def test_token_counter_vendored_encoding():
+    with TemporaryDirectory() as tempdir:
+        write_toy_encoding(tempdir)
+        counter = TokenCounter(maxsize=2, encodings_dir=tempdir)
+
+        # "he" + "ll" + "o"
+        assert counter.count_tokens("hello", model="gpt4_8k") == 3
+        assert counter.encode_many(["hello", "abc", "hello", ""]) == [3, 3, 3, 0]
+        assert counter.cache_info() == {"hits": 2, "misses": 3, "size": 2, "maxsize": 2}
+
+        # "hello" was evicted by the bounded cache, "" is still cached
+        assert counter.encode_many(["", "hello"]) == [0, 3]
+        assert counter.hits == 3
+        assert counter.misses == 4
+
 
 def test_calculate_cost():
     # round to 2 decimal places
@@ -54,19 +129,7 @@ def test_messages_per_day():
     assert calculate_cost("gpt4_8k", 5, MESSAGES_PER_DAY * 30) > calculate_cost("gpt4_8k", 5, MESSAGES_PER_DAY * 15)
 
 
-@pytest.fixture
-def mock_calculate_cost():
-    with patch('calculator.calculate_cost') as mock:
-        mock.return_value = 10.0
-        yield mock
-
-@pytest.fixture
-def mock_calculate_cost_ai21():
-    with patch('calculator.calculate_cost_ai21') as mock:
-        mock.return_value = 20.0
-        yield mock
-
-def test_export_cost_to_csv(mock_calculate_cost, mock_calculate_cost_ai21):
+def test_export_cost_to_csv():
     with TemporaryDirectory() as tempdir:
         csv_file = os.path.join(tempdir, 'costs.csv')
         export_cost_to_csv(csv_file)
@@ -74,11 +137,9 @@ def test_export_cost_to_csv(mock_calculate_cost, mock_calculate_cost_ai21):
         assert os.path.isfile(csv_file)
 
         with open(csv_file, 'r') as f:
-            header(
-                f, mock_calculate_cost, mock_calculate_cost_ai21
-            )
+            header(f)
 
-def header(f, mock_calculate_cost, mock_calculate_cost_ai21):
+def header(f):
     reader = csv.reader(f)
     headers = next(reader)
     assert headers == [
@@ -103,9 +164,9 @@ def header(f, mock_calculate_cost, mock_calculate_cost_ai21):
     ]
 
     for model, prompt_size in itertools.product(openai_models, range(LOWER_BOUND_PROMPT_SIZE, UPPER_BOUND_PROMPT_SIZE + 1)):
-        expected_cost = 10.0
         for messages_per_day in range(1, 26):
             expected_tokens_per_month = messages_per_day * TOKENS_PER_MESSAGE
+            expected_cost = calculate_cost(model, prompt_size, expected_tokens_per_month)
             row = next(reader)
             assert row[0] == model
             assert int(row[1]) == prompt_size
@@ -113,7 +174,6 @@ def header(f, mock_calculate_cost, mock_calculate_cost_ai21):
             assert int(row[3]) == expected_tokens_per_month
             assert float(row[4]) == expected_cost
 
-    expected_cost = 20.0
     ai21_models = [
         "jumbo",
         "grande",
@@ -123,6 +183,7 @@ def header(f, mock_calculate_cost, mock_calculate_cost_ai21):
     for model in ai21_models:
         for prompt_size, messages_per_day in itertools.product(range(LOWER_BOUND_PROMPT_SIZE, UPPER_BOUND_PROMPT_SIZE + 1), range(1, 26)):
             expected_tokens_per_month = messages_per_day * TOKENS_PER_MESSAGE
+            expected_cost = calculate_cost_ai21(model, prompt_size, expected_tokens_per_month)
             row = next(reader)
             assert row[0] == model
             assert int(row[1]) == prompt_size
@@ -130,8 +191,74 @@ def header(f, mock_calculate_cost, mock_calculate_cost_ai21):
             assert int(row[3]) == expected_tokens_per_month
             assert float(row[4]) == expected_cost
 
+    assert next(reader, None) is None
+
+
+def test_calculate_cost_grid():
+    # The vectorized engine must be bit-for-bit identical to the scalar functions
+    prompt_sizes = [0, 1, 2, 3, 10, 201, 5000]
+    tokens_per_month = [0, 1, 1000, 18000, 123457]
+    for model_id, model in enumerate(GRID_MODELS):
+        scalar = calculate_cost if model in OPENAI_MODELS else calculate_cost_ai21
+        for prompt_size, tokens in itertools.product(prompt_sizes, tokens_per_month):
+            cost = calculate_cost_grid([model_id], [prompt_size], [tokens])
+            assert cost[0] == scalar(model, prompt_size, tokens)
+
+    with pytest.raises(ValueError):
+        calculate_cost_grid([0], [1], [1], models=["gpt5"])
+
 
-def test_calculate_costs(capsys):
+def test_build_cost_grid():
+    model_ids, prompt_sizes, messages_per_day, tokens_per_month, costs = build_cost_grid(
+        ["gpt4_8k", "jumbo"], range(10, 13), range(1, 3)
+    )
+    assert model_ids.tolist() == [0] * 6 + [1] * 6
+    assert prompt_sizes.tolist() == [10, 10, 11, 11, 12, 12] * 2
+    assert messages_per_day.tolist() == [1, 2] * 6
+    assert tokens_per_month.tolist() == [1000, 2000] * 6
+    assert costs[0] == calculate_cost("gpt4_8k", 10, 1000)
+    assert costs[-1] == calculate_cost_ai21("jumbo", 12, 2000)
+
+
+def test_export_cost_to_csv_workers():
+    with TemporaryDirectory() as tempdir:
+        serial_file = os.path.join(tempdir, 'serial.csv')
+        parallel_file = os.path.join(tempdir, 'parallel.csv')
+        export_cost_to_csv(serial_file, lower_bound_prompt_size=1, upper_bound_prompt_size=2000)
+        export_cost_to_csv(parallel_file, lower_bound_prompt_size=1, upper_bound_prompt_size=2000, workers=2)
+
+        with open(serial_file, 'rb') as serial, open(parallel_file, 'rb') as parallel:
+            assert serial.read() == parallel.read()
+
+
+def test_bounded_map():
+    from concurrent.futures import ThreadPoolExecutor
+
+    submitted = []
+
+    class CountingExecutor(ThreadPoolExecutor):
+        def submit(self, function, *args):
+            submitted.append(args)
+            return super().submit(function, *args)
+
+    with CountingExecutor(max_workers=2) as executor:
+        results = []
+        for result in calculator_module._bounded_map(executor, lambda x: x * x, range(100), 4):
+            assert len(submitted) - len(results) <= 4
+            results.append(result)
+    assert results == [x * x for x in range(100)]
+
+
+def test_grid_chunks():
+    chunks = list(grid_chunks(["gpt4_8k", "jumbo"], 1, 10, range(1, 26), chunk_rows=100))
+    assert chunks == [
+        ("gpt4_8k", 1, 4), ("gpt4_8k", 5, 8), ("gpt4_8k", 9, 10),
+        ("jumbo", 1, 4), ("jumbo", 5, 8), ("jumbo", 9, 10),
+    ]
+
+
+def test_calculate_costs(capsys, monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
     calculate_costs(1, 5, 25)
     captured = capsys.readouterr()
     assert "Calculating costs for different models..." in captured.out
@@ -140,6 +267,21 @@ def test_calculate_costs(capsys):
     assert "Model: image_256" in captured.out
 
 
+def test_calculate_costs_export(capsys, monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    calculate_costs(1, 5, 25)
+    assert not os.listdir(tmp_path)
+
+    calculate_costs(1, 5, 25, export="grid.csv")
+    captured = capsys.readouterr()
+    assert captured.out.count("Costs exported to CSV file.") == 1
+    with open(tmp_path / "grid.csv") as f:
+        assert sum(1 for _ in csv.reader(f)) == 1 + len(GRID_MODELS) * 5 * 25
+
+    with pytest.raises(typer.BadParameter):
+        calculate_costs(1, 5, 25, export="grid.xlsx", format="xlsx")
+
+
 def test_calculate_api_billing():
     # Test with default values (all zero requests)
     assert calculate_api_billing() == 0
@@ -163,7 +305,36 @@ def test_calculate_api_billing():
     )
     assert total_cost == 9.0
 
-def test_export_cost_to_df(mock_calculate_cost, mock_calculate_cost_ai21):
+
+@given(st.lists(st.tuples(st.sampled_from("abc"), *[st.integers(0, 10**9)] * 6), min_size=1, max_size=50))
+def test_calculate_api_billing_batch(rows):
+    apis = list(TASK_API_COSTS)
+    table = pd.DataFrame(rows, columns=["tenant"] + apis)
+    costs, totals = calculate_api_billing_batch(table, groups="tenant")
+
+    expected_totals = {}
+    for row, cost in zip(rows, costs):
+        scalar = calculate_api_billing(**{f"{api}_requests": count for api, count in zip(apis, row[1:])})
+        assert cost == scalar
+        expected_totals[row[0]] = expected_totals.get(row[0], 0) + scalar
+    assert totals.to_dict() == expected_totals
+    assert list(totals.index) == list(expected_totals)
+
+    costs, total = calculate_api_billing_batch({"summarize_requests": table["summarize"]})
+    assert total == sum(calculate_api_billing(summarize_requests=count) for count in table["summarize"])
+
+
+def test_calculate_api_billing_batch_invalid():
+    with pytest.raises(ValueError):
+        calculate_api_billing_batch({"translate": [1]})
+    with pytest.raises(ValueError):
+        calculate_api_billing_batch({"paraphrase": [1, 2], "summarize": [1]})
+    for exact in (False, True):
+        for tenant in (None, float("nan")):
+            with pytest.raises(ValueError):
+                calculate_api_billing_batch({"paraphrase": [1, 2, 3], "tenant": ["a", tenant, "b"]}, "tenant", exact)
+
+def test_export_cost_to_df():
     df = export_cost_to_df()
 
     # Check DataFrame structure
@@ -173,16 +344,702 @@ def test_export_cost_to_df(mock_calculate_cost, mock_calculate_cost_ai21):
     # Check row count
     openai_models = 13
     ai21_models = 3
-    prompt_sizes = UPPER_BOUND_PROMPT_SIZE
+    prompt_sizes = UPPER_BOUND_PROMPT_SIZE - LOWER_BOUND_PROMPT_SIZE + 1
     messages_per_day = 25
     expected_row_count = (openai_models + ai21_models) * prompt_sizes * messages_per_day
     assert len(df) == expected_row_count
 
-    # Check row content (use the mocked cost values)
-    openai_cost = 10.0
-    ai21_cost = 20.0
-    for _, row in df.iterrows():
-        if row['Model'] in ['jumbo', 'grande', 'large']:
-            assert row['Cost per Month ($)'] == ai21_cost
+    # Check row content against the scalar cost functions
+    for row in df.itertuples(index=False):
+        model, prompt_size, _, tokens_per_month, cost = row
+        if model in ['jumbo', 'grande', 'large']:
+            assert cost == calculate_cost_ai21(model, prompt_size, tokens_per_month)
         else:
-            assert row['Cost per Month ($)'] == openai_cost
\ No newline at end of file
+            assert cost == calculate_cost(model, prompt_size, tokens_per_month)
+
+
+def test_export_cost_to_df_dtypes():
+    df = export_cost_to_df()
+    assert isinstance(df["Model"].dtype, pd.CategoricalDtype)
+    assert list(df["Model"].cat.categories) == GRID_MODELS
+    assert df["Prompt Size (k words)"].dtype == np.int32
+    assert df["Messages per Day"].dtype == np.int32
+    assert df["Cost per Month ($)"].dtype == np.float64
+
+
+def test_cost_frame_builder():
+    builder = CostFrameBuilder(4, models=["gpt4_8k", "jumbo"])
+    builder.add([0, 1], [10, 11], [1, 2], [1000, 2000], [1.5, 2.5])
+    df = builder.build()
+    assert len(df) == 2
+    assert df["Model"].tolist() == ["gpt4_8k", "jumbo"]
+    assert df["Cost per Month ($)"].tolist() == [1.5, 2.5]
+
+    builder.add([0, 0], [1, 1], [1, 1], [1, 1], [0.0, 0.0])
+    with pytest.raises(ValueError):
+        builder.add([0], [1], [1], [1], [0.0])
+
+
+def test_pricing_table():
+    price = PRICING["gpt4_32k"]
+    assert price.prompt_price == 0.06
+    assert price.completion_price == 0.12
+    assert price.completion_multiplier == 4
+    assert price.unit == "token"
+    assert PRICING["whisper"].unit == "minute"
+    assert PRICING.models("ai21") == ["jumbo", "grande", "large"]
+    assert PRICING.get("jumbo", vendor="openai") is None
+
+    with pytest.raises(AttributeError):
+        price.prompt_price = 0.0
+    with pytest.raises(AttributeError):
+        price.discount = 0.5
+
+
+def test_load_pricing_toml():
+    with TemporaryDirectory() as tempdir:
+        toml_file = os.path.join(tempdir, 'pricing.toml')
+        with open(toml_file, 'w') as f:
+            f.write(
+                'schema_version = 1\n'
+                'version = "2099-01-01"\n'
+                '[models.gpt4_8k]\n'
+                'vendor = "openai"\n'
+                'unit = "token"\n'
+                'prompt_price = 0.3\n'
+                'completion_price = 0.6\n'
+                'completion_multiplier = 1\n'
+                'scales_with_prompt = true\n'
+            )
+        pricing = load_pricing(toml_file)
+
+        assert pricing.version == "2099-01-01"
+        assert pricing.models() == ["gpt4_8k"]
+        assert calculate_cost("gpt4_8k", 201, 1000, pricing) == pytest.approx(10 * calculate_cost("gpt4_8k", 201, 1000))
+        assert calculate_cost("chat_gpt", 201, 1000, pricing) is None
+
+        bad_file = os.path.join(tempdir, 'pricing.json')
+        with open(bad_file, 'w') as f:
+            f.write('{"schema_version": 99, "models": {}}')
+        with pytest.raises(ValueError):
+            load_pricing(bad_file)
+
+
+def test_calculate_usage_cost():
+    # calculate_cost prices tokens_per_month calls of prompt_size_to_token_size tokens each
+    tokens_per_prompt = prompt_size_to_token_size(201)
+    for model in ["gpt4_8k", "gpt4_32k", "chat_gpt"]:
+        assert 1000 * calculate_usage_cost(model, tokens_per_prompt) == pytest.approx(calculate_cost(model, 201, 1000))
+    assert calculate_usage_cost("jumbo", tokens_per_prompt) * 1000 == pytest.approx(calculate_cost_ai21("jumbo", 201, 1000))
+    assert calculate_usage_cost("ada", 1000) == pytest.approx(calculate_cost("ada", 201, 1000))
+    assert calculate_usage_cost("image_512", quantity=5) == pytest.approx(calculate_cost("image_512", 201, 5))
+    assert calculate_usage_cost("whisper", quantity=120) == pytest.approx(calculate_cost("whisper", 201, 120))
+
+    assert calculate_usage_cost("gpt4_8k", 1000, 500) == pytest.approx(0.06)
+    assert calculate_usage_cost("jumbo", 1000, 0) == pytest.approx(0.015)
+    assert calculate_usage_cost("image_256", quantity=10) == pytest.approx(0.16)
+    assert calculate_usage_cost("whisper", quantity=120) == pytest.approx(0.012)
+    with pytest.raises(ValueError):
+        calculate_usage_cost("gpt5", 10)
+
+
+def test_price_log():
+    with TemporaryDirectory() as tempdir:
+        write_toy_encoding(tempdir)
+        counter = TokenCounter(encodings_dir=tempdir)
+        log_file = os.path.join(tempdir, 'log.jsonl')
+        with open(log_file, 'w') as f:
+            f.write(
+                '{"model": "gpt4_8k", "timestamp": "2023-03-14T10:00:00Z", "prompt_tokens": 1000, "completion_tokens": 500}\n'
+                '{"model": "gpt4_8k", "timestamp": 1678838400, "prompt": "hello", "completion": "hello"}\n'
+                '{"model": "chat_gpt", "date": "2023-03-15", "prompt": "hello"}\n'
+                '\n'
+                '{"model": "gpt5", "date": "2023-03-15", "prompt_tokens": 3}\n'
+            )
+
+        priced = list(price_usage_records(read_usage_log(log_file), counter=counter, batch_size=2))
+        assert priced[1][:4] == ("gpt4_8k", "2023-03-15", 3, 3)
+        assert priced[2][:4] == ("chat_gpt", "2023-03-15", 3, 3)
+        assert priced[3][-1] is None
+        assert counter.hits == 2
+
+        aggregates, skipped = aggregate_usage(priced)
+        assert skipped == 1
+        assert aggregates[("gpt4_8k", "2023-03-14")] == [1, 1000, 500, pytest.approx(0.06)]
+
+        csv_log_file = os.path.join(tempdir, 'log.csv')
+        with open(csv_log_file, 'w') as f:
+            f.write(
+                'model,date,prompt_tokens,completion_tokens\n'
+                'gpt4_8k,2023-03-14,1000,500\n'
+                'chat_gpt,2023-03-15,10,\n'
+            )
+        output = os.path.join(tempdir, 'usage.csv')
+        price_log(csv_log_file, output=output)
+        with open(output) as f:
+            rows = list(csv.reader(f))
+        assert rows[0] == USAGE_COLUMNS
+        assert [row[:3] for row in rows[1:]] == [
+            ["chat_gpt", "2023-03-15", "1"],
+            ["gpt4_8k", "2023-03-14", "1"],
+        ]
+
+
+def test_price_log_timestamps_and_counts():
+    records = [
+        {"model": "gpt4_8k", "timestamp": 1678838400123, "prompt_tokens": "12.0", "completion_tokens": 3.0},
+        {"model": "gpt4_8k", "timestamp": "1678838400123456", "prompt_tokens": 12},
+        {"model": "gpt4_8k", "timestamp": 1e300, "prompt_tokens": "12.5"},
+        {"model": "image_256", "timestamp": "nan", "quantity": "2.0"},
+        {"model": "image_256", "date": "2023-03-15", "quantity": "two"},
+        {"model": "image_256", "date": "2023-03-15", "quantity": 0},
+    ]
+    priced = list(price_usage_records(records))
+    assert priced[0] == ("gpt4_8k", "2023-03-15", 12, 3, calculate_usage_cost("gpt4_8k", 12, 3))
+    assert priced[1][:3] == ("gpt4_8k", "2023-03-15", 12)
+    assert priced[2][-1] is None
+    assert priced[3] == ("image_256", "unknown", 0, 0, calculate_usage_cost("image_256", quantity=2))
+    assert priced[4][-1] is None
+    assert priced[5][-1] == 0
+    assert aggregate_usage(priced)[1] == 2
+
+
+@pytest.mark.parametrize("format, compression", [
+    ("npz", None), ("npz", "deflate"), ("parquet", None), ("parquet", "zstd"), ("arrow", None), ("arrow", "zstd"),
+])
+def test_export_cost_to_columnar(format, compression):
+    if format != "npz":
+        pytest.importorskip("pyarrow")
+    expected = export_cost_to_df()
+    with TemporaryDirectory() as tempdir:
+        file = os.path.join(tempdir, f"costs.{format}")
+        export_cost_to_columnar(file, compression=compression)
+
+        df = read_cost_grid(file)
+        assert isinstance(df["Model"].dtype, pd.CategoricalDtype)
+        assert df["Prompt Size (k words)"].dtype == np.int32
+        pd.testing.assert_frame_equal(df.astype({"Model": str}), expected.astype({"Model": str}))
+
+        df = read_cost_grid(file, models=["jumbo", "chat_gpt"], prompt_sizes=(300, 302))
+        assert df["Model"].tolist() == ["jumbo"] * 75 + ["chat_gpt"] * 75
+        assert df["Prompt Size (k words)"].tolist() == [300] * 25 + [301] * 25 + [302] * 25 + [300] * 25 + [301] * 25 + [302] * 25
+        assert df["Cost per Month ($)"].iloc[-1] == calculate_cost("chat_gpt", 302, 25000)
+
+        with pytest.raises(ValueError):
+            read_cost_grid(file, models=["gpt5"])
+
+
+def test_export_unknown_format():
+    with TemporaryDirectory() as tempdir:
+        file = os.path.join(tempdir, "costs.xlsx")
+        with pytest.raises(ValueError):
+            export_cost_to_df(file, format="xlsx")
+        with pytest.raises(ValueError):
+            calculator_module._write_columnar_blocks(file, "xlsx", ["jumbo"], [0], [1], [1], [1000], [0.5], None)
+        assert not os.path.exists(file)
+
+
+# Regression threshold for `import calculator`, well above the ~100 ms it takes without the heavy dependencies
+IMPORT_TIME_BUDGET_US = 300_000
+
+
+def test_import_time():
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import calculator"],
+        capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    # Lines look like "import time:   self [us] | cumulative | module"
+    cumulative = {}
+    for line in result.stderr.splitlines()[1:]:
+        _, cumulative_us, module = line.split("|")
+        cumulative[module.strip()] = int(cumulative_us)
+
+    for heavy_module in ["numpy", "pandas", "tiktoken", "tokenizers", "rich", "pyarrow"]:
+        assert heavy_module not in cumulative
+    assert cumulative["calculator"] < IMPORT_TIME_BUDGET_US
+
+
+def test_pricing_server_route():
+    server = PricingServer()
+    status, payload = server.route("POST", "/quote", b'{"model": "gpt4_32k", "prompt_size": 300, "tokens_per_month": 18000}')
+    assert status == 200
+    assert payload["cost"] == calculate_cost("gpt4_32k", 300, 18000)
+
+    items = [
+        {"model": model, "prompt_size": prompt_size, "tokens_per_month": 1000 * messages}
+        for model, prompt_size, messages in itertools.product(GRID_MODELS, [1, 250], [1, 25])
+    ]
+    status, payload = server.route("POST", "/batch", json.dumps({"items": items}).encode())
+    assert status == 200
+    assert payload["costs"] == [quote_cost(**item) for item in items]
+
+    status, payload = server.route("POST", "/billing", b'{"summarize_requests": 1000}')
+    assert (status, payload) == (200, {"cost": 5.0})
+
+    assert server.route("POST", "/quote", b'{"model": "gpt5", "prompt_size": 1, "tokens_per_month": 1}')[0] == 400
+    assert server.route("POST", "/batch", b'{"items": [{"model": "gpt4_8k"}]}')[0] == 400
+    for prompt_size in (10.7, True, "10"):
+        item = {"model": "gpt4_8k", "prompt_size": prompt_size, "tokens_per_month": 5000}
+        assert server.route("POST", "/quote", json.dumps(item).encode())[0] == 400
+        assert server.route("POST", "/batch", json.dumps({"items": [item]}).encode())[0] == 400
+    assert server.route("GET", "/quote", b"")[0] == 404
+
+
+def test_pricing_server_http():
+    async def exchange():
+        server = await PricingServer().start(port=0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            responses = []
+            for body in [b'{"model": "jumbo", "prompt_size": 4, "tokens_per_month": 15000}', b'{"model": "gpt5"}']:
+                writer.write(b"POST /quote HTTP/1.1\r\nContent-Length: %d\r\n\r\n%s" % (len(body), body))
+                status = (await reader.readline()).split()[1]
+                headers = {}
+                while (line := await reader.readline()) != b"\r\n":
+                    name, _, value = line.decode().partition(":")
+                    headers[name.lower()] = value.strip()
+                responses.append((status, json.loads(await reader.readexactly(int(headers["content-length"])))))
+            writer.close()
+        return responses
+
+    (status, payload), (error_status, _) = asyncio.run(exchange())
+    assert status == b"200"
+    assert payload["cost"] == calculate_cost_ai21("jumbo", 4, 15000)
+    assert error_status == b"400"
+
+
+def test_cost_cache():
+    with TemporaryDirectory() as tempdir:
+        file = os.path.join(tempdir, 'quotes.sqlite')
+        cache = CostCache(file, maxsize=2)
+        assert cache.calculate_cost("gpt4_8k", 250, 18000) == calculate_cost("gpt4_8k", 250, 18000)
+        assert cache.calculate_cost("gpt4_8k", 250, 18000) == calculate_cost("gpt4_8k", 250, 18000)
+        assert cache.calculate_cost_ai21("jumbo", 250, 18000) == calculate_cost_ai21("jumbo", 250, 18000)
+        assert cache.calculate_cost("jumbo", 250, 18000) is None
+        assert cache.cache_info() == {"hits": 1, "disk_hits": 0, "misses": 2, "size": 2, "maxsize": 2}
+        cache.close()
+
+        # A new process finds the quotes on disk
+        cache = CostCache(file)
+        assert cache.calculate_cost("gpt4_8k", 250, 18000) == calculate_cost("gpt4_8k", 250, 18000)
+        assert cache.disk_hits == 1
+        cache.close()
+
+        # A price change invalidates the stored quotes
+        prices = [ModelPrice(**dict(price.as_dict(), prompt_price=price.prompt_price * 2)) for price in PRICING]
+        pricing = PricingTable(prices)
+        assert pricing.fingerprint != PRICING.fingerprint
+        cache = CostCache(file, pricing)
+        assert cache.calculate_cost("gpt4_8k", 250, 18000) == calculate_cost("gpt4_8k", 250, 18000, pricing)
+        assert (cache.disk_hits, cache.misses) == (0, 1)
+        cache.close()
+
+
+def test_export_cost_partitions():
+    def read_partitions(directory):
+        return {
+            name: open(os.path.join(directory, name), 'rb').read()
+            for name in os.listdir(directory) if name.endswith('.csv')
+        }
+
+    def expected_partitions(pricing, lower, upper):
+        with TemporaryDirectory() as fresh:
+            export_cost_partitions(fresh, pricing, lower, upper)
+            return read_partitions(fresh)
+
+    with TemporaryDirectory() as tempdir:
+        actions = export_cost_partitions(tempdir, None, 200, 300)
+        assert set(actions.values()) == {"written"}
+        assert read_partitions(tempdir)["jumbo.csv"].count(b"\n") == 1 + 101 * 25
+
+        mtime = os.stat(os.path.join(tempdir, "jumbo.csv")).st_mtime_ns
+        assert set(export_cost_partitions(tempdir, None, 200, 300).values()) == {"unchanged"}
+        assert os.stat(os.path.join(tempdir, "jumbo.csv")).st_mtime_ns == mtime
+
+        assert set(export_cost_partitions(tempdir, None, 200, 320).values()) == {"appended"}
+        assert read_partitions(tempdir) == expected_partitions(None, 200, 320)
+
+        assert set(export_cost_partitions(tempdir, None, 190, 310).values()) == {"updated"}
+        assert read_partitions(tempdir) == expected_partitions(None, 190, 310)
+
+        prices = [
+            ModelPrice(**dict(price.as_dict(), prompt_price=0.05)) if price.name == "gpt4_8k" else price
+            for price in PRICING if price.name != "large"
+        ]
+        pricing = PricingTable(prices)
+        actions = export_cost_partitions(tempdir, pricing, 190, 310)
+        assert actions["gpt4_8k"] == "written"
+        assert actions["large"] == "removed"
+        assert actions["jumbo"] == "unchanged"
+        assert read_partitions(tempdir) == expected_partitions(pricing, 190, 310)
+
+        assert set(export_cost_partitions(tempdir, pricing, 400, 410).values()) == {"written"}
+        assert read_partitions(tempdir) == expected_partitions(pricing, 400, 410)
+
+
+def test_export_cost_partitions_interrupted():
+    def read_partitions(directory):
+        return {
+            name: open(os.path.join(directory, name), 'rb').read()
+            for name in os.listdir(directory) if name.endswith('.csv')
+        }
+
+    price_chunk = calculator_module._cost_grid_csv_chunk
+
+    def interrupted_chunk(task, **kwargs):
+        if task[0] == "jumbo":
+            raise KeyboardInterrupt
+        return price_chunk(task, **kwargs)
+
+    with TemporaryDirectory() as tempdir, TemporaryDirectory() as fresh:
+        export_cost_partitions(fresh, None, 200, 320)
+        export_cost_partitions(tempdir, None, 200, 300)
+        with patch.object(calculator_module, "_cost_grid_csv_chunk", interrupted_chunk):
+            with pytest.raises(KeyboardInterrupt):
+                export_cost_partitions(tempdir, None, 200, 320)
+        actions = export_cost_partitions(tempdir, None, 200, 320)
+        assert actions["gpt4_8k"] == "unchanged"
+        assert actions["jumbo"] == "appended"
+        assert read_partitions(tempdir) == read_partitions(fresh)
+
+        # Rows appended by a run interrupted before it saved the manifest
+        with open(os.path.join(tempdir, "gpt4_8k.csv"), "a") as f:
+            f.write("gpt4_8k,321,1,0.0\n")
+        assert export_cost_partitions(tempdir, None, 200, 320)["gpt4_8k"] == "unchanged"
+        assert read_partitions(tempdir) == read_partitions(fresh)
+
+
+@given(
+    st.sampled_from(GRID_MODELS),
+    st.floats(min_value=0, max_value=1e6),
+    st.integers(min_value=0, max_value=100_000),
+)
+def test_solve_budget_tokens_per_month(model, budget, prompt_size):
+    tokens_per_month = solve_budget(model, budget, prompt_size=prompt_size)
+    if tokens_per_month == math.inf:
+        assert quote_cost(model, prompt_size, 10**15) <= budget
+    else:
+        assert quote_cost(model, prompt_size, tokens_per_month) <= budget
+        assert quote_cost(model, prompt_size, tokens_per_month + 1) > budget
+
+
+@given(
+    st.sampled_from(["gpt4_8k", "gpt4_32k", "chat_gpt", "jumbo", "large"]),
+    st.floats(min_value=0, max_value=1e6),
+    st.integers(min_value=1, max_value=10_000_000),
+)
+def test_solve_budget_prompt_size(model, budget, tokens_per_month):
+    prompt_size = solve_budget(model, budget, tokens_per_month=tokens_per_month)
+    assert prompt_size == max_affordable(lambda size: quote_cost(model, size, tokens_per_month), budget, lower=1)
+
+
+@settings(deadline=None)
+@given(
+    st.sampled_from(GRID_MODELS),
+    st.floats(min_value=1e10, max_value=1e18),
+    st.integers(min_value=0, max_value=100_000),
+)
+def test_solve_budget_large(model, budget, prompt_size):
+    tokens_per_month = solve_budget(model, budget, prompt_size=prompt_size)
+    if tokens_per_month != math.inf:
+        assert tokens_per_month < MAX_AFFORDABLE
+        assert quote_cost(model, prompt_size, tokens_per_month) <= budget
+        assert quote_cost(model, prompt_size, tokens_per_month + 1) > budget
+
+
+def test_solve_budget():
+    assert solve_budget("ada", 100, tokens_per_month=1000) == math.inf
+    assert solve_budget("ada", 0.001, tokens_per_month=1000) is None
+    assert solve_budget("gpt4_8k", -1, prompt_size=10) is None
+    assert solve_budget("gpt4_8k", 1, prompt_size=1) == math.inf
+    with pytest.raises(ValueError):
+        solve_budget("gpt4_8k", 1)
+    with pytest.raises(ValueError):
+        solve_budget("gpt5", 1, prompt_size=10)
+
+    ranking = rank_models_by_budget(100, 500)
+    assert [model for model, _ in ranking][:2] == ["embedding_ada", "embedding_curie"]
+    assert ranking[-1] == ("gpt4_32k", solve_budget("gpt4_32k", 100, prompt_size=500))
+    assert {model for model, _ in ranking} == {price.name for price in PRICING if price.unit == "token"}
+    assert solve_budget("ada", 1e12, prompt_size=100) == math.inf
+
+    assert max_affordable(lambda x: x * x, 50) == 7
+    assert max_affordable(lambda x: x, -1) is None
+
+
+def test_simulate_spend():
+    spend, messages = simulate_spend(
+        ["gpt4_8k", "jumbo", "embedding_ada"],
+        trials=3,
+        days=30,
+        messages_per_day="constant:25",
+        prompt_tokens="constant:500",
+        completion_tokens="constant:200",
+    )
+    assert messages.tolist() == [750] * 3
+    for model, model_spend in zip(["gpt4_8k", "jumbo", "embedding_ada"], spend):
+        assert model_spend.tolist() == pytest.approx([750 * calculate_usage_cost(model, 500, 200)] * 3)
+
+    spend, _ = simulate_spend(["chat_gpt"], trials=2, messages_per_day="constant:1", prompt_tokens="constant:1000")
+    assert spend.tolist() == [[30 * calculate_usage_cost("chat_gpt", 1000)] * 2]
+
+    with pytest.raises(ValueError):
+        simulate_spend(["dalle_1024"])
+    with pytest.raises(ValueError):
+        simulate_spend(["gpt4_8k"], trials=0)
+    with pytest.raises(ValueError):
+        simulate_spend(["gpt4_8k"], days=0)
+    with pytest.raises(typer.BadParameter):
+        simulate(trials=0)
+    with pytest.raises(ValueError):
+        parse_distribution("zipf:2")
+    with pytest.raises(ValueError):
+        parse_distribution("poisson:25,1")
+
+
+def test_simulate_spend_reproducible():
+    spend, messages = simulate_spend(trials=500, completion_tokens="lognormal:200,1", seed=42)
+    with patch("calculator.SIMULATION_CHUNK_MESSAGES", 1000):
+        chunked_spend, chunked_messages = simulate_spend(trials=500, completion_tokens="lognormal:200,1", seed=42)
+    assert (messages == chunked_messages).all()
+    assert (spend == chunked_spend).all()
+    assert not (simulate_spend(trials=500, seed=43)[0] == spend).all()
+
+    percentiles = spend_percentiles(spend)
+    assert percentiles.shape == (len(spend), len(SIMULATION_PERCENTILES))
+    assert (percentiles[:, 0] <= percentiles[:, 1]).all() and (percentiles[:, 1] <= percentiles[:, 2]).all()
+
+
+@given(
+    st.sampled_from(GRID_MODELS),
+    st.integers(min_value=0, max_value=100_000),
+    st.integers(min_value=0, max_value=10**9),
+)
+def test_calculate_cost_exact(model, prompt_size, tokens_per_month):
+    scalar = calculate_cost_ai21 if model in AI21_MODELS else calculate_cost
+    micros = scalar(model, prompt_size, tokens_per_month, exact=True)
+    assert isinstance(micros, int)
+    assert abs(micros - scalar(model, prompt_size, tokens_per_month) * MICROS_PER_DOLLAR) <= 0.5 + micros * 1e-12
+    grid = calculate_cost_grid([GRID_MODELS.index(model)], [prompt_size], [tokens_per_month], exact=True)
+    assert grid.dtype == np.int64 and grid.tolist() == [micros]
+
+
+def test_exact_rounding_and_overflow():
+    # 3 tokens of ada at $0.0016 per 1k tokens cost 4.8 micro-dollars
+    assert calculate_cost("ada", 1, 3, exact=True) == 5
+    # 2.5 and 3.5 micro-dollars round half to even
+    pricing = PricingTable([ModelPrice("half", "openai", "token", 0.0005)])
+    assert calculate_cost("half", 1, 5, pricing, exact=True) == 2
+    assert calculate_cost("half", 1, 7, pricing, exact=True) == 4
+    assert calculate_cost_grid([0, 0], [1, 1], [5, 7], ["half"], pricing, exact=True).tolist() == [2, 4]
+
+    with pytest.raises(OverflowError):
+        calculate_cost("gpt4_32k", 10**6, 10**15, exact=True)
+    with pytest.raises(OverflowError):
+        calculate_cost_grid([0], [10**6], [10**15], exact=True)
+    with pytest.raises(ValueError):
+        to_micros(0.0000001)
+
+    assert to_micros(0.0004) == 400
+    assert micros_to_decimal(1_234_567) == Decimal("1.234567")
+    assert sum_micros([2**62, 2**62, -5, 2**62]) == 3 * 2**62 - 5
+
+
+def test_exact_api_billing_and_exports(tmp_path):
+    assert calculate_api_billing(paraphrase_requests=3, text_improvement_requests=7, exact=True) == 6500
+    table = {"tenant": ["a", "b", "a"], "summarize": [1, 2, 3], "grammar_correction_requests": [10**12, 0, 1]}
+    costs, totals = calculate_api_billing_batch(table, groups="tenant", exact=True)
+    assert costs.tolist() == [
+        calculate_api_billing(summarize_requests=s, grammar_correction_requests=g, exact=True)
+        for s, g in zip(table["summarize"], table["grammar_correction_requests"])
+    ]
+    assert totals.to_dict() == {"a": costs[0] + costs[2], "b": costs[1]}
+    assert calculate_api_billing_batch(table, exact=True)[1] == sum(costs.tolist())
+    with pytest.raises(OverflowError):
+        calculate_api_billing_batch({"summarize": [2**62]}, exact=True)
+    with pytest.raises(ValueError):
+        calculate_api_billing_batch({"summarize": [1.5]}, exact=True)
+
+    export_cost_to_csv(tmp_path / "exact.csv", lower_bound_prompt_size=1, upper_bound_prompt_size=3, exact=True)
+    df = pd.read_csv(tmp_path / "exact.csv")
+    assert df.columns[-1] == EXACT_COST_COLUMN
+    for row in df.itertuples(index=False):
+        scalar = calculate_cost_ai21 if row[0] in AI21_MODELS else calculate_cost
+        assert row[-1] == scalar(row[0], row[1], row[3], exact=True)
+    assert (export_cost_to_df(exact=True)[EXACT_COST_COLUMN].dtype) == np.int64
+
+
+def test_profiling(tmp_path):
+    events = []
+    with profiling(Profiler(hooks=[lambda *event: events.append(event)])) as profiler:
+        export_cost_to_csv(tmp_path / "costs.csv", lower_bound_prompt_size=1, upper_bound_prompt_size=4)
+        calculate_cost("gpt4_8k", 1, 1)
+        calculate_cost_ai21("jumbo", 1, 1, exact=True)
+    calculate_cost("gpt4_8k", 1, 1)
+
+    rows = len(GRID_MODELS) * 4 * 25
+    summary = profiler.summary()
+    assert summary["counters"]["rows written"] == summary["counters"]["cells priced"] == rows
+    assert summary["counters"]["bytes flushed"] == os.path.getsize(tmp_path / "costs.csv") - len(",".join(GRID_COLUMNS)) - 2
+    assert summary["counters"]["calls: gpt4_8k"] == 1
+    assert summary["counters"]["calls: jumbo"] == 1
+    assert summary["stages"]["grid pricing"]["calls"] == len(GRID_MODELS)
+    assert summary["stages"]["prompt generation"]["calls"] == len(GRID_MODELS)
+    assert ("count", "calls: gpt4_8k", 1) in events
+    assert sum(1 for event in events if event[0] == "stage") == sum(
+        stage["calls"] for stage in summary["stages"].values()
+    )
+
+
+def test_calculate_costs_profile(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    calculate_costs(1, 5, 25, profile_json="profile.json", cache="cache.sqlite")
+    with open("profile.json") as f:
+        summary = json.load(f)
+    assert summary["stages"]["total"]["calls"] == 1
+    assert summary["counters"]["cost cache misses"] == 2 * len(OPENAI_MODELS)
+
+
+def test_compare_scenarios():
+    proposed = PricingTable(
+        [ModelPrice("gpt4_8k", "openai", "token", 0.01, 0.02, 1, True), PRICING["jumbo"], PRICING["ada"]],
+        version="proposed",
+    )
+    comparison = compare_scenarios({"current": PRICING, "proposed": proposed}, prompt_sizes=range(1, 40))
+    assert comparison.costs.shape == (2, len(GRID_MODELS), 39, 25)
+    for scenario, pricing in [(0, PRICING), (1, proposed)]:
+        for index, model in enumerate(comparison.models):
+            costs = comparison.costs[scenario, index].ravel()
+            if model in pricing:
+                assert (costs == build_cost_grid([model], range(1, 40), pricing=pricing)[-1]).all()
+            else:
+                assert np.isnan(costs).all()
+
+    gpt4 = comparison.models.index("gpt4_8k")
+    assert (comparison.diff("proposed")[gpt4] <= 0).all()
+    assert (comparison.diff("proposed")[comparison.models.index("jumbo")] == 0).all()
+    df = comparison.to_frame()
+    assert len(df) == len(GRID_MODELS) * 39 * 25
+    assert (df.loc[df["Model"] == "jumbo", "Diff ($) [proposed]"] == 0).all()
+    assert df.loc[df["Model"] == "large", "Diff ($) [proposed]"].isna().all()
+
+    comparison = compare_scenarios({"current": PRICING, "proposed": proposed}, models=["gpt4_8k", "jumbo"])
+    cheapest = comparison.cheapest_frame()
+    for row in cheapest.sample(50, random_state=0).itertuples(index=False):
+        prompt_size, messages_per_day, current, cheapest_proposed = row
+        tokens_per_month = messages_per_day * TOKENS_PER_MESSAGE
+        costs = {"gpt4_8k": calculate_cost("gpt4_8k", prompt_size, tokens_per_month, proposed),
+                 "jumbo": calculate_cost_ai21("jumbo", prompt_size, tokens_per_month, proposed)}
+        assert cheapest_proposed == min(costs, key=costs.get)
+
+    with pytest.raises(ValueError):
+        compare_scenarios({"current": PRICING}, models=["gpt5"])
+
+
+def test_export_cost_to_csv_resume(tmp_path):
+    file = tmp_path / "costs.csv"
+    export_cost_to_csv(tmp_path / "expected.csv", lower_bound_prompt_size=1, upper_bound_prompt_size=20)
+    chunk = calculator_module._cost_grid_csv_chunk
+    calls = []
+    interrupt_at = [4]
+
+    def interrupted_chunk(*args, **kwargs):
+        calls.append(args[0])
+        if len(calls) == interrupt_at[0]:
+            raise KeyboardInterrupt
+        return chunk(*args, **kwargs)
+
+    with patch("calculator.EXPORT_CHUNK_ROWS", 100), patch("calculator._cost_grid_csv_chunk", interrupted_chunk):
+        with pytest.raises(KeyboardInterrupt):
+            export_cost_to_csv(file, lower_bound_prompt_size=1, upper_bound_prompt_size=20)
+        assert not file.exists()
+        with open(f"{file}.checkpoint") as f:
+            assert json.load(f)["chunks"] == 3
+        # Rows written after the last checkpoint are dropped on resume
+        with open(f"{file}.partial", "a") as f:
+            f.write("torn,row")
+
+        calls.clear()
+        interrupt_at[0] = None
+        export_cost_to_csv(file, lower_bound_prompt_size=1, upper_bound_prompt_size=20)
+    assert len(calls) == len(GRID_MODELS) * 5 - 3
+    assert file.read_bytes() == (tmp_path / "expected.csv").read_bytes()
+    assert not os.path.exists(f"{file}.partial") and not os.path.exists(f"{file}.checkpoint")
+
+    # A checkpoint of other inputs is not resumed
+    with patch("calculator.EXPORT_CHUNK_ROWS", 100), patch("calculator._cost_grid_csv_chunk", interrupted_chunk):
+        calls.clear()
+        interrupt_at[0] = 4
+        with pytest.raises(KeyboardInterrupt):
+            export_cost_to_csv(file, lower_bound_prompt_size=1, upper_bound_prompt_size=20)
+    export_cost_to_csv(file, lower_bound_prompt_size=1, upper_bound_prompt_size=20)
+    assert file.read_bytes() == (tmp_path / "expected.csv").read_bytes()
+
+
+def test_simulate_conversations():
+    pricing = PricingTable([
+        ModelPrice("chat", "openai", "token", 0.001, 0.002, 1, True, context_window=300),
+        ModelPrice("long", "openai", "token", 0.001, 0.002, 1, True, context_window=10_000),
+    ])
+    spend, turn_counts, truncated_turns = simulate_conversations(
+        sessions=4,
+        turns="constant:3",
+        user_tokens="constant:100",
+        completion_tokens="constant:50",
+        system_tokens=10,
+        pricing=pricing,
+    )
+    assert turn_counts.tolist() == [3] * 4
+    # The second and third turns resend 260 and 410 tokens, truncated to 300 - 50
+    chat = sum(calculate_usage_cost("chat", prompt, 50, pricing=pricing) for prompt in [110, 250, 250])
+    long = sum(calculate_usage_cost("long", prompt, 50, pricing=pricing) for prompt in [110, 260, 410])
+    assert spend.tolist() == [pytest.approx([chat] * 4), pytest.approx([long] * 4)]
+    assert truncated_turns.tolist() == [2 * 4, 0]
+
+    spend, turn_counts, _ = simulate_conversations(sessions=2000, seed=7)
+    with patch("calculator.SIMULATION_CHUNK_MESSAGES", 500):
+        chunked_spend, chunked_turn_counts, _ = simulate_conversations(sessions=2000, seed=7)
+    assert (turn_counts == chunked_turn_counts).all() and (turn_counts >= 1).all()
+    assert (spend == chunked_spend).all()
+    assert spend.shape == (len(conversation_models()), 2000)
+
+    with pytest.raises(ValueError):
+        simulate_conversations(["image_512"])
+    with pytest.raises(ValueError):
+        simulate_conversations(sessions=0)
+    with pytest.raises(typer.BadParameter):
+        simulate_chat(sessions=0)
+
+
+def test_cost_index(tmp_path):
+    df = export_cost_to_df()
+    index = CostIndex.build()
+    assert (index.costs.ravel() == df["Cost per Month ($)"].to_numpy()).all()
+
+    index.save(tmp_path / "index.npz")
+    index = CostIndex.load(tmp_path / "index.npz")
+    assert isinstance(index.costs, np.memmap)
+    assert index.prompt_sizes == range(LOWER_BOUND_PROMPT_SIZE, UPPER_BOUND_PROMPT_SIZE + 1)
+
+    assert index.cost("gpt4_8k", 321, 7) == calculate_cost("gpt4_8k", 321, 7 * TOKENS_PER_MESSAGE)
+    selection = df[(df["Model"] == "jumbo") & df["Prompt Size (k words)"].between(250, 260)]
+    costs = index.costs_in_range("jumbo", (250, 260), 7)
+    assert costs.tolist() == selection.loc[selection["Messages per Day"] == 7, "Cost per Month ($)"].tolist()
+    assert index.costs_in_range("jumbo", (250, 260)).shape == (11, 25)
+    with pytest.raises(ValueError):
+        costs[0] = 0
+
+    cheapest = selection.loc[selection["Cost per Month ($)"].idxmin()]
+    assert index.min("jumbo", (250, 260)) == (
+        cheapest["Cost per Month ($)"], cheapest["Prompt Size (k words)"], cheapest["Messages per Day"]
+    )
+    assert index.max("jumbo", (250, 260), (3, 5)) == (index.cost("jumbo", 260, 5), 260, 5)
+
+    for query in [("gpt5", 300, 1), ("gpt4_8k", 501, 1), ("gpt4_8k", 300, 0)]:
+        with pytest.raises(ValueError):
+            index.cost(*query)
+
+    exact = CostIndex.build(exact=True, prompt_sizes=range(1, 11))
+    assert exact.costs.dtype == np.int64
+    assert exact.cost("jumbo", 10, 3) == calculate_cost_ai21("jumbo", 10, 3000, exact=True)